@@ -0,0 +1,606 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright © 2014 stephen.margheim@gmail.com
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 16-10-2026
+#
+from __future__ import unicode_literals
+
+# Standard Library
+import re
+import sys
+import json
+import time
+import pickle
+import random
+import multiprocessing
+import shutil
+import os.path
+import tempfile
+
+# Workflow Library
+import utils
+from workflow import Workflow
+from workflow.workflow import Settings, manager, read_cache
+from workflow.workflow import (SearchIndex, FieldIndex, PARALLEL_SAMPLE,
+                               match_allchars,
+                               MATCH_ALL, MATCH_ALLCHARS, MATCH_ATOM,
+                               MATCH_CAPITALS, MATCH_INITIALS_CONTAIN,
+                               MATCH_INITIALS_STARTSWITH, MATCH_STARTSWITH,
+                               MATCH_SUBSTRING)
+from metadata import MetadataStore
+from pandoctor import (Pandoc, parse_readme, PANDOC_META, PANDOC_RECORDS,
+                       PANDOC_SECTIONS, FORMAT_DESCRIPTIONS, MAX_RESULTS)
+
+# Dependencies Library
+sys.path.insert(0, Workflow().workflowfile('lib/'))
+from docopt import docopt
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+__usage__ = """
+Bench -- Timings for PanDoctor's hot paths
+
+Usage:
+    bench.py readme [<path>] [--repeat=<n>]
+    bench.py load [--repeat=<n>]
+    bench.py serializers [--repeat=<n>]
+    bench.py filter [--sizes=<list>] [--repeat=<n>] [--budget=<us>]
+                    [--output=<path>]
+    bench.py stress [--processes=<n>] [--rounds=<n>]
+    bench.py check [--rounds=<n>]
+
+Arguments:
+    <path>      Saved copy of the pandoc README (defaults to the cached one)
+
+Options:
+    --repeat=<n>      Number of timed runs per code-path [default: 20]
+    --sizes=<list>    Comma-separated catalog sizes
+                      [default: 100,1000,10000,100000]
+    --budget=<us>     Fail if any rule takes longer than this many
+                      microseconds per item and query [default: 5]
+    --output=<path>   Where to save timings as JSON
+                      [default: bench_filter.json]
+    --processes=<n>   Processes writing and reading at once [default: 8]
+    --rounds=<n>      Writes and reads per process, or random catalogs
+                      to check `filter` on [default: 200]
+    -h, --help        Show this message
+
+This script is meant to be called from a terminal.
+"""
+
+
+##################################################
+# Helpers
+##################################################
+
+
+def best_of(func, repeat):
+    """Return best wall-clock time of ``repeat`` calls to ``func``.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def report(timings):
+    """Print ``(name, seconds)`` pairs relative to the first one.
+    """
+    baseline = timings[0][1]
+    for name, secs in timings:
+        print '{:<28} {:>10.3f} ms {:>8.1f}x'.format(name, secs * 1000,
+                                                     baseline / secs)
+
+
+##################################################
+# README extraction
+##################################################
+
+
+def soup_arg_options(text):
+    """Previous `_arg_option_flags`: walk a full BeautifulSoup tree.
+    """
+    soup = BeautifulSoup(text)
+    cli_arg_options = []
+    for option_set in soup.find_all('dl'):
+        for opt in option_set.find_all('dt'):
+            if '=' in opt.text:
+                cli_arg_options.append(opt.text)
+    return cli_arg_options
+
+
+def stream_arg_options(text):
+    """Current `_arg_option_flags`: one streaming pass.
+    """
+    return [term for term in parse_readme(text).terms if '=' in term]
+
+
+def bench_readme(wf, path, repeat):
+    """Compare README option extraction code-paths.
+    """
+    if path:
+        text = utils.path_read(path)
+    elif os.path.exists(wf.workflowfile('help/pandoc_readme.html')):
+        text = utils.path_read(wf.workflowfile('help/pandoc_readme.html'))
+    else:
+        stored = wf.cached_data('readme', max_age=0)
+        if not stored:
+            raise RuntimeError('No saved README. Pass <path> or run config.')
+        text = stored['text']
+
+    print 'README: {:,} characters, best of {}'.format(len(text), repeat)
+    timings = []
+    if BeautifulSoup is None:
+        print 'bs4 not installed: skipping BeautifulSoup code-path'
+    else:
+        if soup_arg_options(text) != stream_arg_options(text):
+            print 'WARNING: code-paths disagree on extracted options'
+        timings.append(('BeautifulSoup tree',
+                        best_of(lambda: soup_arg_options(text), repeat)))
+    timings.append(('ReadmeParser stream',
+                    best_of(lambda: stream_arg_options(text), repeat)))
+    report(timings)
+
+
+##################################################
+# Metadata loading
+##################################################
+
+
+def bench_load(wf, repeat):
+    """Compare loading `pandoc` metadata from a pickle and the store.
+    """
+    pandoc = Pandoc(wf, revalidate=False)
+    data = dict(pandoc.data)
+    for key in PANDOC_SECTIONS:
+        data[key] = pandoc._section(key)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        pickle_path = os.path.join(tempdir, 'pandoc.cache')
+        with open(pickle_path, 'wb') as file_obj:
+            pickle.dump(data, file_obj)
+        store_path = os.path.join(tempdir, 'pandoc.store')
+        MetadataStore(store_path, PANDOC_RECORDS).save(data)
+
+        def load_pickle():
+            with open(pickle_path, 'rb') as file_obj:
+                return pickle.load(file_obj)
+
+        def load_store(keys):
+            store = MetadataStore(store_path, PANDOC_RECORDS)
+            return dict((key, store.load(key)) for key in keys)
+
+        print 'pickle: {:,} bytes, store: {:,} bytes, best of {}'.format(
+            os.path.getsize(pickle_path), os.path.getsize(store_path), repeat)
+        report([
+            ('pickle (all sections)', best_of(load_pickle, repeat)),
+            ('store (all sections)',
+             best_of(lambda: load_store(PANDOC_META + PANDOC_SECTIONS),
+                     repeat)),
+            ('store (meta + options)',
+             best_of(lambda: load_store(PANDOC_META + ('options',)),
+                     repeat)),
+            ('store (meta only)',
+             best_of(lambda: load_store(PANDOC_META), repeat))
+        ])
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def bench_serializers(wf, repeat):
+    """Compare loading `pandoc` metadata with each cache serializer.
+
+    The baseline is ``pandoc.cache`` as it used to be written: plain
+    `pickle` with its default text protocol.
+    """
+    pandoc = Pandoc(wf, revalidate=False)
+    data = dict(pandoc.data)
+    for key in PANDOC_SECTIONS:
+        data[key] = pandoc._section(key)
+
+    name = 'bench_serializers'
+    cache_path = wf.cachefile('{}.cache'.format(name))
+
+    def load():
+        read_cache.discard(cache_path)
+        return wf.cached_data(name, max_age=0)
+
+    timings = []
+    try:
+        with open(cache_path, 'wb') as file_obj:
+            pickle.dump(data, file_obj)
+        if load() != data:
+            raise AssertionError('legacy pickle: data changed')
+        timings.append(('pickle (legacy pandoc.cache)',
+                        best_of(load, repeat)))
+
+        for serializer in manager.serializers:
+            wf.cache_data(name, data, serializer=serializer)
+            loaded = load()
+            # JSON turns tuples into lists
+            if serializer != 'json' and loaded != data:
+                raise AssertionError('{}: data changed'.format(serializer))
+            timings.append(('{} ({:,} bytes)'.format(
+                serializer, os.path.getsize(cache_path)),
+                best_of(load, repeat)))
+
+        loaded = wf.cached_data(name, max_age=0)
+        if wf.cached_data(name, max_age=0) is not loaded:
+            raise AssertionError('read_cache: data reloaded')
+        timings.append(('read_cache hit',
+                        best_of(lambda: wf.cached_data(name, max_age=0),
+                                repeat)))
+    finally:
+        wf.cache_data(name, None)
+
+    print 'Loading pandoc.cache with `cached_data`, best of {}'.format(repeat)
+    report(timings)
+
+
+##################################################
+# Fuzzy filtering
+##################################################
+
+
+# Long options of `pandoc`, to build realistic search keys from
+OPTION_NAMES = (
+    'from', 'to', 'output', 'data-dir', 'strict', 'parse-raw', 'smart',
+    'old-dashes', 'base-header-level', 'indented-code-classes',
+    'default-image-extension', 'filter', 'metadata', 'normalize',
+    'preserve-tabs', 'tab-stop', 'track-changes', 'extract-media',
+    'standalone', 'template', 'variable', 'print-default-template',
+    'print-default-data-file', 'no-wrap', 'columns', 'toc',
+    'table-of-contents', 'toc-depth', 'no-highlight', 'highlight-style',
+    'include-in-header', 'include-before-body', 'include-after-body',
+    'self-contained', 'offline', 'html5', 'html-q-tags', 'ascii',
+    'reference-links', 'atx-headers', 'chapters', 'number-sections',
+    'number-offset', 'no-tex-ligatures', 'listings', 'incremental',
+    'slide-level', 'section-divs', 'email-obfuscation', 'id-prefix',
+    'title-prefix', 'css', 'reference-odt', 'reference-docx',
+    'epub-stylesheet', 'epub-cover-image', 'epub-metadata',
+    'epub-embed-font', 'epub-chapter-level', 'latex-engine',
+    'latex-engine-opt', 'bibliography', 'csl', 'citation-abbreviations',
+    'natbib', 'biblatex', 'latexmathml', 'mathml', 'jsmath', 'mathjax',
+    'gladtex', 'mimetex', 'webtex', 'katex', 'katex-stylesheet',
+    'dump-args', 'ignore-args', 'verbose', 'version', 'help'
+)
+
+# Rules timed on their own, then as PanDoctor combines them
+FILTER_RULES = (
+    ('MATCH_STARTSWITH', MATCH_STARTSWITH),
+    ('MATCH_CAPITALS', MATCH_CAPITALS),
+    ('MATCH_ATOM', MATCH_ATOM),
+    ('MATCH_INITIALS_STARTSWITH', MATCH_INITIALS_STARTSWITH),
+    ('MATCH_INITIALS_CONTAIN', MATCH_INITIALS_CONTAIN),
+    ('MATCH_SUBSTRING', MATCH_SUBSTRING),
+    ('MATCH_ALLCHARS', MATCH_ALLCHARS),
+    ('MATCH_ALL ^ MATCH_ALLCHARS', MATCH_ALL ^ MATCH_ALLCHARS),
+    ('MATCH_ALL', MATCH_ALL)
+)
+
+# What users type: prefixes, initials, atoms, several words, no match
+FILTER_QUERIES = ('t', 'tab', 'tab-stop', 'ts', 'html', 'epub cover',
+                  'Lat', 'xq')
+
+
+def synthetic_catalog(size, seed=0):
+    """Get ``size`` search keys shaped like PanDoctor's options and formats.
+    """
+    rand = random.Random(seed)
+    formats = sorted(FORMAT_DESCRIPTIONS.items())
+    arg_types = ('NUMBER', 'FORMAT', 'FILE', 'URL', 'KEY[:VAL]', 'STRING')
+    catalog = []
+    while len(catalog) < size:
+        if rand.random() < 0.3:
+            name, desc = rand.choice(formats)
+            catalog.append(' '.join([name, desc]))
+            continue
+        name = rand.choice(OPTION_NAMES)
+        if len(catalog) >= len(OPTION_NAMES):
+            # Keep keys distinct, as a large real catalog would be
+            name = '{}-{}'.format(name, rand.choice(OPTION_NAMES))
+        if rand.random() < 0.5:
+            catalog.append('--{} Boolean  (on/off)  '.format(name))
+        else:
+            catalog.append('--{}={} Argument (required)'.format(
+                name, rand.choice(arg_types)))
+    return catalog
+
+
+def check_filter(wf, catalog):
+    """Check the fast paths of `Workflow.filter` against the plain one.
+
+    Fast paths are a `SearchIndex`, a single-field `FieldIndex`, a
+    `QueryPlan`, top-k selection and, for catalogs big enough, a process
+    pool.
+
+    :returns: ``list`` of failure descriptions
+    """
+    failures = []
+    index = SearchIndex(catalog)
+    fields = FieldIndex(catalog, ((lambda x: x, 1.0),))
+    for name, rule in FILTER_RULES:
+        for query in FILTER_QUERIES:
+            full = wf.filter(query, catalog, include_score=True,
+                             match_on=rule)
+            if wf.filter(query, index, include_score=True,
+                         match_on=rule) != full:
+                failures.append('{} `{}`: index differs'.format(name, query))
+            if wf.filter(query, fields, include_score=True,
+                         match_on=rule) != full:
+                failures.append('{} `{}`: fields differ'.format(name, query))
+            plan = wf.query_plan(query, match_on=rule)
+            if wf.filter(plan, index, include_score=True) != full:
+                failures.append('{} `{}`: plan differs'.format(name, query))
+            for limit in (1, MAX_RESULTS):
+                if wf.filter(query, index, include_score=True,
+                             match_on=rule, max_results=limit) != full[:limit]:
+                    failures.append('{} `{}`: top {} differs'.format(
+                        name, query, limit))
+            if rule == MATCH_ALL and len(catalog) > PARALLEL_SAMPLE:
+                if wf.filter(query, index, include_score=True,
+                             match_on=rule, parallel=True) != full:
+                    failures.append('{} `{}`: pool differs'.format(name,
+                                                                   query))
+    return failures
+
+
+def check_filter_random(wf, rounds, seed=0):
+    """Check `Workflow.filter` on random catalogs and queries.
+
+    Catalogs repeat keys and mix in keys of equal length, so many
+    matches tie on score. For each round:
+
+    - the result is in the documented order: best score first, then
+      by lower-case key, then by position
+    - ``max_results=k`` gives the head of that order, with and without
+      ``min_score`` and ``ascending``
+    - a `SearchIndex`, a `FieldIndex` and a `QueryPlan` give the same
+      result as the plain list
+    - `match_allchars` finds the match of the regular expression it
+      replaces
+
+    :returns: ``list`` of failure descriptions
+    """
+    rand = random.Random(seed)
+    failures = []
+    for round_ in range(rounds):
+        words = [rand.choice(OPTION_NAMES) for _ in range(rand.randint(1, 8))]
+        catalog = [{'key': rand.choice(words) + rand.choice(
+            ('', '', ' html', ' TOC', '-x', '\ntab')), 'pos': i}
+            for i in range(rand.randint(1, 200))]
+        query = rand.choice(FILTER_QUERIES + tuple(
+            word[:rand.randint(1, 4)] for word in words))
+        name, rule = rand.choice(FILTER_RULES)
+        min_score = rand.choice((0, 0, 50, 90))
+        label = 'round {} {} `{}` min_score={}'.format(round_, name, query,
+                                                      min_score)
+
+        def run(items, **kwargs):
+            return wf.filter(query, items, key=lambda item: item['key'],
+                             include_score=True, match_on=rule,
+                             min_score=min_score, **kwargs)
+
+        full = run(catalog)
+        ordered = sorted(full, key=lambda result: (
+            -result[1], result[0]['key'].lower(), result[0]['pos']))
+        if full != ordered:
+            failures.append('{}: not in documented order'.format(label))
+        for k in set((1, 2, 5, MAX_RESULTS, len(full), len(full) + 3)):
+            if run(catalog, max_results=k) != ordered[:k]:
+                failures.append('{}: top {} differs'.format(label, k))
+            if run(catalog, max_results=k, ascending=True) != \
+                    ordered[:k][::-1]:
+                failures.append('{}: ascending top {} differs'.format(label,
+                                                                      k))
+
+        keys = [item['key'] for item in catalog]
+        plain = wf.filter(query, keys, include_score=True, match_on=rule,
+                          min_score=min_score)
+        plan = wf.query_plan(query, match_on=rule)
+        for kind, got in (
+                ('index', wf.filter(query, SearchIndex(keys),
+                                    include_score=True, match_on=rule,
+                                    min_score=min_score)),
+                ('fields', wf.filter(query, FieldIndex(
+                    keys, ((lambda x: x, 1.0),)), include_score=True,
+                    match_on=rule, min_score=min_score)),
+                ('plan', wf.filter(plan, keys, include_score=True,
+                                   min_score=min_score))):
+            if got != plain:
+                failures.append('{}: {} differs'.format(label, kind))
+
+        for key in keys:
+            text = key.lower()
+            regex = re.compile(''.join('.*?' + re.escape(c)
+                                       for c in query.lower()))
+            match = regex.search(text)
+            expected = match and (match.start(), match.end())
+            if match_allchars(text, query.lower()) != expected:
+                failures.append('{}: allchars differs on `{}`'.format(
+                    label, key))
+    return failures
+
+
+def bench_filter(wf, sizes, repeat, budget, output):
+    """Time every match rule against catalogs of each size in ``sizes``.
+    """
+    results = {'repeat': repeat, 'budget_us': budget, 'queries':
+               list(FILTER_QUERIES), 'sizes': {}, 'failures': []}
+
+    for size in sizes:
+        catalog = synthetic_catalog(size)
+        if size <= 10000:
+            results['failures'].extend(check_filter(wf, catalog))
+            results['failures'].extend(check_filter_random(wf, 20,
+                                                           seed=size))
+
+        start = time.time()
+        index = SearchIndex(catalog)
+        timings = {'index_ms': (time.time() - start) * 1000}
+        print 'Catalog of {:,} items, indexed in {:.1f} ms'.format(
+            size, timings['index_ms'])
+
+        # Fewer runs for big catalogs: they are slow enough to measure
+        runs = max(1, repeat * 100 // size)
+        for name, rule in FILTER_RULES:
+            secs = best_of(lambda: [wf.filter(q, index, match_on=rule,
+                                              max_results=MAX_RESULTS)
+                                    for q in FILTER_QUERIES], runs)
+            per_item = secs * 1e6 / (size * len(FILTER_QUERIES))
+            timings[name] = {'ms': secs * 1000, 'us_per_item': per_item}
+            print '  {:<28} {:>10.1f} ms {:>8.2f} us/item'.format(
+                name, secs * 1000, per_item)
+            if budget and per_item > budget:
+                results['failures'].append(
+                    '{} at {:,} items: {:.2f} us/item'.format(name, size,
+                                                              per_item))
+        if size > PARALLEL_SAMPLE:
+            secs = best_of(lambda: [wf.filter(q, index, match_on=MATCH_ALL,
+                                              max_results=MAX_RESULTS,
+                                              parallel=True)
+                                    for q in FILTER_QUERIES], runs)
+            timings['MATCH_ALL (process pool)'] = {'ms': secs * 1000}
+            print '  {:<28} {:>10.1f} ms'.format('MATCH_ALL (process pool)',
+                                                 secs * 1000)
+        results['sizes'][str(size)] = timings
+
+    with open(output, 'wb') as file_obj:
+        json.dump(results, file_obj, indent=2, sort_keys=True)
+    print 'Timings saved at : {}'.format(output)
+
+    if results['failures']:
+        raise RuntimeError('Filter regressions:\n' +
+                           '\n'.join(results['failures']))
+
+
+##################################################
+# Concurrent cache, store and settings writes
+##################################################
+
+
+# Items in each payload: big enough to take several writes to disk
+STRESS_ITEMS = 5000
+
+
+def stress_worker(args):
+    """Write then read back the cache and settings ``rounds`` times.
+
+    :returns: ``list`` of failure descriptions
+    """
+    writer, rounds = args
+    wf = Workflow()
+    settings_path = wf.cachefile('bench_stress.json')
+    store_path = wf.cachefile('bench_stress.store')
+    failures = []
+    for round_ in range(rounds):
+        wf.cache_data('bench_stress', {'writer': writer,
+                                       'items': [writer] * STRESS_ITEMS})
+        try:
+            # Read the file, not what this process just wrote
+            read_cache.discard(wf.cachefile('bench_stress.cache'))
+            data = wf.cached_data('bench_stress', max_age=0)
+            if len(set(data['items'])) != 1 or \
+                    len(data['items']) != STRESS_ITEMS:
+                failures.append('cache: mixed data')
+        except Exception as err:
+            failures.append('cache: {!r}'.format(err))
+
+        try:
+            # Each writer adds its own section, so none may get lost
+            store = MetadataStore(store_path)
+            store.save({'round_{}'.format(writer): round_,
+                        'items': [writer] * STRESS_ITEMS})
+            store = MetadataStore(store_path)
+            if store.load('round_{}'.format(writer)) != round_:
+                failures.append('store: lost section')
+            if len(set(store.load('items'))) != 1:
+                failures.append('store: mixed data')
+        except Exception as err:
+            failures.append('store: {!r}'.format(err))
+
+        try:
+            settings = Settings(settings_path)
+            settings['items'] = [writer] * (STRESS_ITEMS // 10)
+            items = Settings(settings_path)['items']
+            if len(set(items)) != 1:
+                failures.append('settings: mixed data')
+        except Exception as err:
+            failures.append('settings: {!r}'.format(err))
+    return failures
+
+
+def bench_stress(wf, processes, rounds):
+    """Hammer `cache_data`, `MetadataStore` and `Settings` from
+    ``processes`` processes.
+    """
+    start = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(stress_worker,
+                           [(n, rounds) for n in range(processes)])
+    finally:
+        pool.terminate()
+    failures = [f for result in results for f in result]
+    print '{} processes x {} rounds in {:.1f} s: {} failures'.format(
+        processes, rounds, time.time() - start, len(failures))
+
+    for path in (wf.cachefile('bench_stress.cache'),
+                 wf.cachefile('bench_stress.cache.lock'),
+                 wf.cachefile('bench_stress.json'),
+                 wf.cachefile('bench_stress.json.lock'),
+                 wf.cachefile('bench_stress.store'),
+                 wf.cachefile('bench_stress.store.lock')):
+        if os.path.exists(path):
+            os.unlink(path)
+
+    if failures:
+        raise RuntimeError('Concurrent writes failed:\n' +
+                           '\n'.join(sorted(set(failures))))
+
+
+def bench_check(wf, rounds):
+    """Check `Workflow.filter` on ``rounds`` random catalogs."""
+    start = time.time()
+    failures = check_filter_random(wf, rounds)
+    print '{} random catalogs in {:.1f} s: {} failures'.format(
+        rounds, time.time() - start, len(failures))
+    if failures:
+        raise RuntimeError('Filter checks failed:\n' + '\n'.join(failures))
+
+
+def main(wf):
+    """main"""
+    args = docopt(__usage__, argv=wf.args)
+    repeat = int(args['--repeat'])
+    if args['readme']:
+        bench_readme(wf, args['<path>'], repeat)
+    elif args['load']:
+        bench_load(wf, repeat)
+    elif args['serializers']:
+        bench_serializers(wf, repeat)
+    elif args['filter']:
+        sizes = [int(n) for n in args['--sizes'].split(',')]
+        bench_filter(wf, sizes, repeat, float(args['--budget']),
+                     args['--output'])
+    elif args['stress']:
+        bench_stress(wf, int(args['--processes']), int(args['--rounds']))
+    elif args['check']:
+        bench_check(wf, int(args['--rounds']))
+
+
+if __name__ == '__main__':
+    WF = Workflow()
+    sys.exit(WF.run(main))
@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright © 2014 stephen.margheim@gmail.com
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 16-10-2026
+#
+from __future__ import unicode_literals
+
+# Standard Library
+import os
+import time
+from fnmatch import fnmatch
+
+# Workflow Library
+from workflow.workflow import LockFile, read_cache
+
+# Seconds between two sweeps of the cache directory
+SWEEP_INTERVAL = 60 * 60
+
+# Bookkeeping files of the manager itself
+STATS_NAME = 'cache_stats'
+SWEEP_STAMP = 'cache_sweep.stamp'
+
+# Namespace of files that match no other
+OTHER = 'other'
+
+
+###########################################################################
+# Cache directory manager                                                 #
+###########################################################################
+
+class CacheManager(object):
+    """Evicts stale files from the workflow's cache directory and keeps
+    per-namespace usage statistics.
+
+    Files belong to the first namespace with a matching pattern, or to
+    :const:`OTHER`, which is never evicted. A sweep deletes the files
+    of a namespace that are older than its TTL, then the least recently
+    used ones while the namespace is over its size bound. Either limit
+    may be ``None``.
+
+    Lock files are never evicted: another process may be about to lock
+    one, and deleting it would let two processes hold "the" lock.
+
+    :param wf: :class:`workflow.Workflow` instance
+    :param namespaces: ``((name, (pattern, ...), ttl, max_bytes), ...)``
+    :type namespaces: ``tuple``
+    :param interval: minimum seconds between two sweeps
+    :type interval: ``int``
+    """
+
+    def __init__(self, wf, namespaces, interval=SWEEP_INTERVAL):
+        self.wf = wf
+        self.namespaces = namespaces
+        self.interval = interval
+
+    def namespace(self, filename):
+        """Name of the namespace ``filename`` belongs to"""
+
+        for name, patterns, _, _ in self.namespaces:
+            for pattern in patterns:
+                if fnmatch(filename, pattern):
+                    return name
+        return OTHER
+
+    def files(self):
+        """``{namespace: [(path, stat), ...]}`` of all cache files"""
+
+        files = {}
+        cachedir = self.wf.cachedir
+        for filename in os.listdir(cachedir):
+            path = os.path.join(cachedir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:  # deleted meanwhile
+                continue
+            files.setdefault(self.namespace(filename), []).append(
+                (path, stat))
+        return files
+
+    def usage(self):
+        """``{namespace: (files, bytes)}`` of the cache directory"""
+
+        return dict((name, (len(entries),
+                            sum(stat.st_size for _, stat in entries)))
+                    for name, entries in self.files().items())
+
+    def sweep_due(self):
+        """Has :attr:`interval` passed since the last sweep?"""
+
+        try:
+            last = os.stat(self.wf.cachefile(SWEEP_STAMP)).st_mtime
+        except OSError:
+            return True
+        return time.time() - last >= self.interval
+
+    def sweep_if_due(self):
+        """Run :meth:`record` and :meth:`sweep` if a sweep is due.
+        Otherwise costs a single ``stat``.
+        """
+
+        if self.sweep_due():
+            self.record()
+            return self.sweep()
+        return []
+
+    def sweep(self, now=None):
+        """Evict expired and least recently used files.
+
+        :returns: ``list`` of deleted paths
+        """
+
+        now = now or time.time()
+        with open(self.wf.cachefile(SWEEP_STAMP), 'a'):
+            os.utime(self.wf.cachefile(SWEEP_STAMP), None)
+
+        files = self.files()
+        evicted = []
+        for name, _, ttl, max_bytes in self.namespaces:
+            # Least recently used first
+            entries = sorted(files.get(name, ()),
+                             key=lambda entry: max(entry[1].st_atime,
+                                                   entry[1].st_mtime))
+            kept = []
+            for path, stat in entries:
+                if ttl is not None and now - stat.st_mtime > ttl and \
+                        self._evict(path):
+                    evicted.append(path)
+                else:
+                    kept.append((path, stat))
+
+            size = sum(stat.st_size for _, stat in kept)
+            for path, stat in kept:
+                if max_bytes is None or size <= max_bytes:
+                    break
+                if self._evict(path):
+                    evicted.append(path)
+                    size -= stat.st_size
+
+        for path in evicted:
+            self.wf.logger.debug('Evicted from cache : %s', path)
+        return evicted
+
+    def record(self):
+        """Add this process's reads of cached data to the statistics.
+
+        A read is a hit if a fresh cache file, or the copy of it already
+        in memory, served it. :meth:`sweep_if_due` only records the runs
+        that sweep, so the statistics are a sample of about one run per
+        :attr:`interval`, which keeps other runs from rewriting them.
+        Concurrent runs may lose each other's counts, which is fine for
+        statistics.
+        """
+
+        counts = {}
+        for counter, column in ((read_cache.hits, 0), (read_cache.misses, 0),
+                                (read_cache.absent, 1)):
+            for path, count in counter.items():
+                name = self.namespace(os.path.basename(path))
+                counts.setdefault(name, [0, 0])[column] += count
+        if not counts:
+            return
+
+        stats = self.stats()
+        for name, (hits, misses) in counts.items():
+            total = stats.get(name, (0, 0))
+            stats[name] = (total[0] + hits, total[1] + misses)
+        self.wf.cache_data(STATS_NAME, stats, serializer='marshal')
+
+    def stats(self):
+        """``{namespace: (hits, misses)}`` recorded so far"""
+
+        return dict(self.wf.cached_data(STATS_NAME, max_age=0) or {})
+
+    def _evict(self, path):
+        """Delete cache file ``path``, under its lock if it has one.
+
+        :returns: ``True`` if the file was deleted
+        """
+
+        try:
+            if os.path.exists(path + '.lock'):
+                with LockFile(path):
+                    read_cache.discard(path)
+                    os.unlink(path)
+            else:
+                os.unlink(path)
+        except OSError:  # deleted meanwhile
+            return False
+        return True
+
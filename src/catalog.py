@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright © 2014 stephen.margheim@gmail.com
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 16-10-2026
+#
+from __future__ import unicode_literals
+
+
+###########################################################################
+# Option records                                                          #
+###########################################################################
+
+class Option(object):
+    """A single `pandoc` option, as parsed from ``pandoc --help``."""
+
+    __slots__ = ('flag', 'full', 'type', 'arg_type', 'status')
+
+    def __init__(self, flag, full, type, arg_type, status):
+        self.flag = flag
+        self.full = full
+        self.type = type
+        self.arg_type = arg_type
+        self.status = status
+
+    @classmethod
+    def from_dict(cls, record):
+        """Create an :class:`Option` from a ``pandoc.cache`` record."""
+
+        return cls(record['flag'], record['full'], record['type'],
+                   record['arg_type'], record['status'])
+
+    @property
+    def long_form(self):
+        """Long form of option without its argument, e.g. ``--tab-stop``"""
+
+        return self.full.split('[=')[0].split('=')[0]
+
+    @property
+    def is_boolean(self):
+        """Is this an on/off option?"""
+
+        return self.arg_type is None
+
+    def __repr__(self):
+        return 'Option({!r}, status={!r})'.format(self.full, self.status)
+
+
+###########################################################################
+# Option catalog                                                          #
+###########################################################################
+
+class OptionCatalog(object):
+    """Indexed, read-only collection of all `pandoc` options.
+
+    Options keep the order of ``pandoc --help``. Lookups by flag,
+    long form and type are dictionary lookups.
+    """
+
+    def __init__(self, records):
+        self.options = tuple(Option.from_dict(r) for r in records)
+        self.by_flag = {}
+        self.by_long = {}
+        self.by_type = {}
+        for opt in self.options:
+            self.by_flag[opt.flag] = opt
+            self.by_long[opt.long_form] = opt
+            self.by_type.setdefault(opt.type, []).append(opt)
+        self.defaults = tuple(opt for opt in self.options
+                              if opt.status is True)
+
+    def __iter__(self):
+        return iter(self.options)
+
+    def __len__(self):
+        return len(self.options)
+
+    def __contains__(self, flag):
+        return flag in self.by_flag
+
+    def get(self, flag, default=None):
+        """Get option by its ``flag``, e.g. ``tab-stop``"""
+
+        return self.by_flag.get(flag, default)
+
+    def get_long(self, long_form, default=None):
+        """Get option by its ``long_form``, e.g. ``--tab-stop``"""
+
+        return self.by_long.get(long_form, default)
+
+    def of_type(self, kind):
+        """Get all options of type ``kind``"""
+
+        return self.by_type.get(kind, [])
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright © 2014 stephen.margheim@gmail.com
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 16-10-2026
+#
+from __future__ import unicode_literals
+
+# Standard Library
+import os
+import mmap
+import struct
+import marshal
+
+# Workflow Library
+from workflow.workflow import LockFile, atomic_writer
+
+# File layout:
+#   magic | header (format version, marshal version, index size) |
+#   index: marshalled {name: (offset, length)} | section blobs
+MAGIC = b'PDMS'
+HEADER = struct.Struct(b'<HHI')
+
+# Bump whenever the layout or the record encoding changes
+FORMAT_VERSION = 1
+
+
+###########################################################################
+# Metadata store                                                          #
+###########################################################################
+
+class MetadataStore(object):
+    """Compact, versioned, memory-mapped store of named sections.
+
+    Each section is marshalled on its own, so reading one section
+    never decodes the others. Sections named in ``records`` are lists
+    of ``dict`` records, stored as tuples in the given field order.
+
+    A missing, foreign or outdated file behaves as an empty store.
+
+    :param path: where to save the store
+    :type path: ``unicode``
+    :param records: ``{section: (field, ...)}`` of record sections
+    :type records: ``dict``
+    """
+
+    def __init__(self, path, records=None):
+        self.path = path
+        self.records = records or {}
+        self._map = None
+        self._index = {}
+        self._start = 0
+        self._open()
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def names(self):
+        """Names of all stored sections"""
+
+        return list(self._index)
+
+    def load(self, name, default=None):
+        """Decode and return section ``name``"""
+
+        if name not in self._index:
+            return default
+        value = marshal.loads(self._raw(name))
+        fields = self.records.get(name)
+        if fields is not None:
+            value = [dict(zip(fields, row)) for row in value]
+        return value
+
+    def save(self, sections):
+        """Atomically write ``sections`` (a ``dict``) to the store.
+
+        Stored sections missing from ``sections`` are carried over
+        without being decoded. They are read afresh under the store's
+        lock, so sections another process saved meanwhile are kept.
+        """
+
+        with LockFile(self.path):
+            self._open()
+            blobs = {}
+            for name in self._index:
+                if name not in sections:
+                    blobs[name] = self._raw(name)
+            for name, value in sections.items():
+                fields = self.records.get(name)
+                if fields is not None and value is not None:
+                    value = tuple(tuple(rec[f] for f in fields)
+                                  for rec in value)
+                blobs[name] = marshal.dumps(value)
+
+            index = {}
+            offset = 0
+            for name in sorted(blobs):
+                index[name] = (offset, len(blobs[name]))
+                offset += len(blobs[name])
+            index_blob = marshal.dumps(index)
+
+            with atomic_writer(self.path) as file_obj:
+                file_obj.write(MAGIC)
+                file_obj.write(HEADER.pack(FORMAT_VERSION, marshal.version,
+                                           len(index_blob)))
+                file_obj.write(index_blob)
+                for name in sorted(blobs):
+                    file_obj.write(blobs[name])
+            self._open()
+
+    def _open(self):
+        """Map the store file and read its index"""
+
+        self._map = None
+        self._index = {}
+        try:
+            file_obj = open(self.path, 'rb')
+        except IOError:
+            return
+        with file_obj:
+            if os.fstat(file_obj.fileno()).st_size <= len(MAGIC) + HEADER.size:
+                return
+            mapped = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fmt_start = len(MAGIC)
+        idx_start = fmt_start + HEADER.size
+        if mapped[:fmt_start] != MAGIC:
+            return
+        fmt_version, marshal_version, size = HEADER.unpack(
+            mapped[fmt_start:idx_start])
+        if (fmt_version, marshal_version) != (FORMAT_VERSION,
+                                              marshal.version):
+            return
+
+        try:
+            index = marshal.loads(mapped[idx_start:idx_start + size])
+        except (ValueError, EOFError, TypeError):
+            return
+        if not isinstance(index, dict):
+            return
+
+        self._map = mapped
+        self._index = index
+        self._start = idx_start + size
+
+    def _raw(self, name):
+        """Marshalled bytes of section ``name``"""
+
+        offset, length = self._index[name]
+        start = self._start + offset
+        return self._map[start:start + length]
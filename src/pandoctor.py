@@ -12,17 +12,28 @@ from __future__ import unicode_literals
 # Standard Library
 import re
 import sys
+import time
 import os.path
+import threading
 import subprocess
+from functools import partial
+from HTMLParser import HTMLParser
+from htmlentitydefs import name2codepoint
+from multiprocessing.pool import ThreadPool
 
 # Workflow Library
 import utils
+from cachedir import CacheManager, OTHER
+from catalog import OptionCatalog
+from metadata import MetadataStore
+from prefs import UserPrefs
 from workflow import Workflow, web
-from workflow.workflow import MATCH_ALL, MATCH_ALLCHARS
+from workflow.background import run_in_background, is_running
+from workflow.workflow import (MATCH_ALL, POOL_OVERHEAD_AGE, FieldIndex,
+                               isascii)
 
 # Dependencies Library
 sys.path.insert(0, Workflow().workflowfile('lib/'))
-from bs4 import BeautifulSoup
 from docopt import docopt
 
 
@@ -51,6 +62,11 @@ This script is meant to be called from Alfred.
 
 DELIMITER = '➣'
 
+# An option followed by its argument in a `pandoc` command
+PANDOC_ARG_RE = re.compile(
+    r'(--|-[^\s]*?)\s([^-](?:[^\s]*?".*?"|[^\s]*?))(?=\s|$)'
+)
+
 TRIGGER_ALFRED = """tell application "Alfred 2" \
                 to run trigger "{}" \
                 in workflow "com.hackademic.pandoctor" \
@@ -80,6 +96,148 @@ DEFAULT_OPTIONS = (
     "standalone"
 )
 
+README = 'http://johnmacfarlane.net/pandoc/README.html'
+
+# First `pandoc` release that can list its own formats and extensions
+LIST_FLAGS_VERSION = (1, 18)
+
+# Where `pandoc` is commonly installed, searched before `$PATH`
+PANDOC_PREFIXES = (
+    '/usr/local/bin',
+    '/opt/homebrew/bin',
+    '/opt/local/bin',
+    '~/.cabal/bin',
+    '~/.local/bin'
+)
+
+# Bookkeeping entries of `pandoc.store`, always loaded
+PANDOC_META = (
+    'fingerprint',
+    'built',
+    'checked',
+    'pinned'
+)
+
+# Field order of record sections in `pandoc.store`
+PANDOC_RECORDS = {
+    'outputs': ('arg', 'description'),
+    'inputs': ('arg', 'description'),
+    'extensions': ('flag', 'status'),
+    'options': ('flag', 'full', 'type', 'arg_type', 'status')
+}
+
+# Seconds before `search` refreshes `pandoc` data in the background.
+# Overridden by the `pandoc_max_age` setting.
+PANDOC_MAX_AGE = 7 * 24 * 60 * 60
+
+# Independent `pandoc` calls made by `Pandoc.config`
+PANDOC_PROBES = (
+    '--version',
+    '--help',
+    '--list-input-formats',
+    '--list-output-formats',
+    '--list-extensions'
+)
+
+# Maximum number of probes `Pandoc.config` runs at once
+PROBE_WORKERS = 4
+
+# Sections of `pandoc.store` built from the `pandoc` binary
+PANDOC_SECTIONS = (
+    'outputs',
+    'inputs',
+    'extensions',
+    'options',
+    'arg_options',
+    'option_map'
+)
+
+# Weighted fields of each searchable section. Matches on the name rank
+# ahead of matches on the description. The section's `FieldIndex` is
+# stored next to it, as section ``<name>_index``.
+SEARCH_FIELDS = {
+    'outputs': (('arg', 1.0), ('description', 0.5)),
+    'inputs': (('arg', 1.0), ('description', 0.5)),
+    'options': (('full', 1.0), ('type', 0.5))
+}
+
+# Rules every search uses
+MATCH_RULES = MATCH_ALL
+
+# Seconds the matches of a search may be refined by the next keystroke
+FILTER_STATE_TTL = 30
+
+# Most results a search shows. Alfred only displays about a dozen.
+MAX_RESULTS = 20
+
+# Files of the cache directory, by namespace: file patterns, seconds
+# before a file expires and most bytes the namespace may hold, either
+# ``None`` for no limit. A file belongs to the first matching namespace.
+CACHE_NAMESPACES = (
+    ('runner', ('runner.cache',), 24 * 60 * 60, None),
+    ('pandoc', ('pandoc.store', 'pandoc.cache'), None, None),
+    ('readme', ('readme.cache',), 30 * 24 * 60 * 60, None),
+    ('argcache', ('*.argcache',), 24 * 60 * 60, 64 * 1024),
+    ('pid', ('*.pid',), 24 * 60 * 60, None),
+    ('filter_state', ('filter_state.cache',), 24 * 60 * 60, None),
+    ('filter_pool', ('filter_pool_*.cache',), 2 * POOL_OVERHEAD_AGE, None),
+    ('log', ('*.log',), None, 2 * 1024 * 1024),
+    ('stats', ('cache_stats.cache', 'cache_sweep.stamp'), None, None),
+    ('locks', ('*.lock',), None, None)
+)
+
+FORMAT_DESCRIPTIONS = {
+    'asciidoc': 'AsciiDoc',
+    'beamer': 'LaTeX beamer slide show',
+    'commonmark': 'CommonMark markdown',
+    'context': 'ConTeXt',
+    'docbook': 'DocBook',
+    'docbook5': 'DocBook 5',
+    'docx': 'Word docx',
+    'dokuwiki': 'DokuWiki markup',
+    'dzslides': 'DZSlides HTML5 + javascript slide show',
+    'epub': 'EPUB v2 book',
+    'epub3': 'EPUB v3',
+    'fb2': 'FictionBook2 e-book',
+    'gfm': 'GitHub-Flavored Markdown',
+    'haddock': 'Haddock markup',
+    'html': 'XHTML 1',
+    'html5': 'HTML 5',
+    'icml': 'InDesign ICML',
+    'ipynb': 'Jupyter notebook',
+    'jats': 'JATS XML',
+    'json': 'JSON version of native AST',
+    'latex': 'LaTeX',
+    'man': 'groff man',
+    'markdown': "pandoc's extended markdown",
+    'markdown_github': 'github extended markdown',
+    'markdown_mmd': 'MultiMarkdown',
+    'markdown_phpextra': 'PHP Markdown Extra extended markdown',
+    'markdown_strict': 'original unextended markdown',
+    'mediawiki': 'MediaWiki markup',
+    'ms': 'groff ms',
+    'muse': 'Muse',
+    'native': 'native Haskell',
+    'odt': 'OpenOffice text document',
+    'opendocument': 'OpenDocument XML',
+    'opml': 'OPML',
+    'org': 'Emacs Org-Mode',
+    'plain': 'plain text',
+    'pptx': 'PowerPoint slide show',
+    'revealjs': 'reveal.js HTML5 + javascript slide show',
+    'rst': 'reStructuredText',
+    'rtf': 'rich text format',
+    's5': 'S5 HTML and javascript slide show',
+    'slideous': 'Slideous HTML and javascript slide show',
+    'slidy': 'Slidy HTML and javascript slide show',
+    't2t': 'txt2tags',
+    'tei': 'TEI Simple',
+    'texinfo': 'GNU Texinfo',
+    'textile': 'Textile',
+    'twiki': 'TWiki markup',
+    'zimwiki': 'ZimWiki markup'
+}
+
 
 ##################################################
 # Applescript Helpers
@@ -91,6 +249,11 @@ def _applescriptify(text):
     """
     return text.replace('"', '" & quote & "')
 
+def _is_executable(path):
+    """Is there an executable file at `path`?
+    """
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
 def run_applescript(scpt_str):
     """Run an applescript.
     """
@@ -100,6 +263,103 @@ def run_applescript(scpt_str):
     return out.strip()
 
 
+##################################################
+# README Parser
+##################################################
+
+
+class ReadmeParser(HTMLParser):
+    """Single streaming pass over the `pandoc` README.
+
+    Keeps only what :class:`Pandoc` needs instead of a full document
+    tree: the text of every ``<dl>``/``<dt>`` term, and the markup of
+    the first paragraph describing the ``-f`` and ``-t`` formats.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.terms = []
+        self.formats = {}
+        self._dl_depth = 0
+        self._term = None       # text of current `<dt>`
+        self._code = None       # text of first `<code>` in current `<dt>`
+        self._first_code = None
+        self._pending = None    # format flag waiting for its `<dd>`
+        self._awaiting = None   # format flag waiting for its `<p>`
+        self._target = None     # format flag of captured paragraph
+        self._para = None       # markup of captured paragraph
+
+
+    def handle_starttag(self, tag, attrs):
+        if self._para is not None:
+            self._para.append(self.get_starttag_text())
+        if tag == 'dl':
+            self._dl_depth += 1
+        elif tag == 'dt' and self._dl_depth:
+            self._term = []
+            self._first_code = None
+            self._pending = self._awaiting = None
+        elif tag == 'code' and self._term is not None:
+            if self._first_code is None and self._code is None:
+                self._code = []
+        elif tag == 'dd' and self._pending:
+            self._awaiting, self._pending = self._pending, None
+        elif tag == 'p' and self._awaiting and self._para is None:
+            self._target, self._awaiting = self._awaiting, None
+            self._para = []
+
+
+    def handle_endtag(self, tag):
+        if tag == 'p' and self._para is not None:
+            self.formats[self._target] = ''.join(self._para)
+            self._para = None
+        elif self._para is not None:
+            self._para.append('</{}>'.format(tag))
+
+        if tag == 'dl' and self._dl_depth:
+            self._dl_depth -= 1
+        elif tag == 'code' and self._code is not None:
+            self._first_code = ''.join(self._code)
+            self._code = None
+        elif tag == 'dt' and self._term is not None:
+            self.terms.append(''.join(self._term))
+            if self._first_code in ('-f', '-t'):
+                self._pending = self._first_code
+            self._term = None
+
+
+    def handle_data(self, data):
+        if self._term is not None:
+            self._term.append(data)
+        if self._code is not None:
+            self._code.append(data)
+        if self._para is not None:
+            self._para.append(data)
+
+
+    def handle_entityref(self, name):
+        if name in name2codepoint:
+            self.handle_data(unichr(name2codepoint[name]))
+        else:
+            self.handle_data('&{};'.format(name))
+
+
+    def handle_charref(self, name):
+        if name.lower().startswith('x'):
+            self.handle_data(unichr(int(name[1:], 16)))
+        else:
+            self.handle_data(unichr(int(name)))
+
+
+def parse_readme(text):
+    """Run ``text`` through a :class:`ReadmeParser` and return it.
+    """
+    parser = ReadmeParser()
+    parser.feed(text)
+    parser.close()
+    return parser
+
+
 ################################################################################
 #     Pandoc Object
 ################################################################################
@@ -108,20 +368,44 @@ class Pandoc(object):
     """All relevant information about user's `pandoc` installation.
     """
     
-    def __init__(self, wf):
+    def __init__(self, wf, path=None, revalidate=True):
         """Initialize `pandoc` object.
+
+        :param path: explicit `pandoc` executable to use. Defaults to
+            ``$PANDOC_PATH``, then to the user's pinned install.
+        :param revalidate: check stored data against the binary now.
+            Pass ``False`` and call :meth:`validate` or, where waiting
+            on `pandoc` is not an option, :meth:`refresh_in_background`
+            before reading any section.
         """
         self.wf = wf
-        self.data = self.get_stored()
+        self.data = self.get_stored() or {}
+        self._override = path or os.environ.get('PANDOC_PATH')
+        self._path = None
+        self._readme_doc = None
+        self._catalog = None
+        self._indexes = {}
+        self._probes = {}
+        self._probe_locks = {}
+        self._probe_lock = threading.Lock()
+        # Only set by `refresh_in_background`, for the search path
+        self._serve_stale = False
+        if revalidate:
+            self.validate()
 
 
     def config(self):
         """Save `pandoc` info to data storage.
         """
-        self.store('pandoc', 'outputs', self._formats('output'))
-        self.store('pandoc', 'inputs', self._formats('input'))
-        self.store('pandoc', 'options', self._options)
-        self.store('pandoc', 'arg_options', self._arg_option_flags)
+        probes = dict((flag, partial(self._pandoc_info, flag))
+                      for flag in PANDOC_PROBES)
+        # Only old versions of `pandoc` need the online README
+        probes['README'] = lambda: self.can_list or self._readme()
+        self._collect(probes)
+
+        self.data['fingerprint'] = self.fingerprint()
+        self.data['checked'] = time.time()
+        self.rebuild(PANDOC_SECTIONS, save=('fingerprint', 'checked'))
         return 1
 
 
@@ -133,52 +417,119 @@ class Pandoc(object):
     @property
     def path(self):
         """Find path to `pandoc` executable.
+
+        Resolved once per run, usually straight from the fingerprint.
         """
-        if os.path.exists('/usr/local/bin/pandoc'):
-            return '/usr/local/bin/pandoc'
-        else:
-            from distutils.spawn import find_executable
-            pandoc_path = find_executable('pandoc')
-            if pandoc_path:
-                return pandoc_path
-            else:
-                raise RuntimeError("Pandoc is not installed!")
+        if self._path is None:
+            self._path = self._resolve_path()
+        return self._path
+
+
+    @property
+    def wanted_path(self):
+        """Explicitly requested or pinned `pandoc`, if any.
+        """
+        return self._override or self.data.get('pinned')
 
 
     @property
     def version(self):
         """Get version of installed `pandoc`.
         """
-        version = self._pandoc_info('--version').splitlines()[0]
-        return version.replace('pandoc ', '').strip()
+        fingerprint = self.data.get('fingerprint')
+        if fingerprint:
+            return fingerprint['version']
+        return self._binary_version()
+
+
+    @property
+    def version_info(self):
+        """Version of installed `pandoc` as a tuple of integers.
+        """
+        return tuple(int(n) for n in re.findall(r'\d+', self.version)[:3])
+
+
+    @property
+    def can_list(self):
+        """Can installed `pandoc` list its own formats and extensions?
+        """
+        return self.version_info >= LIST_FLAGS_VERSION
 
 
     @property
     def outputs(self):
         """All possible output formats for `pandoc`.
         """
-        return self.data['outputs']
+        return self._section('outputs')
 
 
     @property
     def inputs(self):
         """All possible input formats for `pandoc`.
         """
-        return self.data['inputs']
+        return self._section('inputs')
 
 
     @property
     def options(self):
         """All possible options for `pandoc`.
         """
-        return self.data['options']
+        return self._section('options')
+
+
+    @property
+    def catalog(self):
+        """Indexed :class:`OptionCatalog` of all `pandoc` options.
+        """
+        if self._catalog is None:
+            self._catalog = OptionCatalog(self.options)
+        return self._catalog
+
+
+    def search_index(self, key):
+        """:class:`FieldIndex` over section ``key`` for ``Workflow.filter``.
+
+        Items of the ``options`` index are those of :attr:`catalog`.
+        """
+        if key not in self._indexes:
+            records = self._section(key)
+            weights = SEARCH_FIELDS[key]
+            name = key + '_index'
+            if name not in self.data and name in self._store:
+                self.data[name] = self._store.load(name)
+            stored = self.data.get(name)
+            if (not isinstance(stored, dict)
+                    or stored['weights'] != weights
+                    or any(len(f) != len(records) for f in stored['fields'])):
+                # Section was stored without its current index
+                stored = self._search_index(records, weights)
+                self.data[name] = stored
+                self._save(name)
+            items = self.catalog.options if key == 'options' else records
+            self._indexes[key] = FieldIndex.from_fields(items, weights,
+                                                        stored['fields'])
+        return self._indexes[key]
 
 
     @property
     def arg_options(self):
         """All possible options for `pandoc`.
         """
-        return self.data['arg_options']
+        return self._section('arg_options')
+
+
+    @property
+    def option_map(self):
+        """Long form for every short form and alias of argument options.
+        """
+        return self._section('option_map')
+
+
+    @property
+    def extensions(self):
+        """All possible format extensions for `pandoc`.
+        """
+        return self._section('extensions')
 
 
     #-----------------------------------------------------------------
@@ -188,27 +539,168 @@ class Pandoc(object):
 
     def get_stored(self):
         """Get pandoc info from cache file.
+
+        Only the small bookkeeping entries are read here. Sections are
+        read from ``pandoc.store`` when first needed.
         """
-        return self.wf.cached_data('pandoc', max_age=0)
+        self._store = MetadataStore(self.wf.cachefile('pandoc.store'),
+                                    PANDOC_RECORDS)
+        if not len(self._store) and self.wf.cached_data_age('pandoc'):
+            # Carry over data from the old pickled `pandoc.cache`
+            self._store.save(self.wf.cached_data('pandoc', max_age=0))
+            self.wf.cache_data('pandoc', None)
+
+        return dict((key, self._store.load(key)) for key in PANDOC_META
+                    if key in self._store)
 
 
-    def store(self, name, key, data):
-        """Updates `name` cache file with the `data`.
+    def fingerprint(self):
+        """Identify the installed `pandoc` binary.
+
+        :returns: ``dict`` of path, resolved path, inode, mtime,
+            size and version string
         """
-        if hasattr(data, '__call__'):
-            wrapper = data
-            data = data()
-        else:
-            def wrapper(): return {key: data}
+        path = self.path
+        stat = os.stat(path)
+        return {'path': path,
+                'realpath': os.path.realpath(path),
+                'inode': stat.st_ino,
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'version': self._binary_version()}
+
+
+    def validate(self):
+        """Check stored data still describes the installed `pandoc`.
+
+        A single ``stat`` of the stored binary path is enough when
+        nothing changed. Otherwise the fingerprint is refreshed and
+        sections built for another version get rebuilt on next access.
+        """
+        self._serve_stale = False
+        fingerprint = self.data.get('fingerprint')
+        wanted = self.wanted_path
+        if (fingerprint is not None
+                and wanted in (None, fingerprint['path'])
+                and self._stat_matches(fingerprint)):
+            self._path = fingerprint['path']
+            return True
+
+        try:
+            self.data['fingerprint'] = self.fingerprint()
+        except (RuntimeError, OSError) as err:
+            self.wf.logger.debug('Cannot fingerprint `pandoc` : %s', err)
+            return False
+
+        self.wf.logger.debug('`pandoc` binary changed : %s',
+                             self.data['fingerprint'])
+        self._save('fingerprint')
+        return False
+
+
+    def refresh_in_background(self, max_age):
+        """Keep stored data, refreshing it in the background if it is
+        older than ``max_age`` seconds or the binary has changed.
+
+        Only blocks when there is no stored data to serve at all. Until
+        the refresh is done, stored sections are served even if they
+        were built for another version. If the refresh cannot be
+        started, the stored data is served as it is.
+
+        :returns: ``True`` if a refresh is under way
+        """
+        if not self.data:
+            self.validate()
+            self.data['checked'] = time.time()
+            self._save('checked')
+            return False
+        self._serve_stale = True
+        if is_running('pandoc_refresh'):
+            return True
+
+        fingerprint = self.data.get('fingerprint')
+        built = self.data.get('built') or {}
+        if (fingerprint is not None
+                and time.time() - self.data.get('checked', 0) < max_age
+                and self._stat_matches(fingerprint)
+                and all(built.get(key) == fingerprint['version']
+                        for key in PANDOC_SECTIONS)):
+            return False
+
+        self.wf.logger.debug('Refreshing stale `pandoc` data in background')
+        try:
+            retcode = run_in_background('pandoc_refresh',
+                                        [sys.executable,
+                                         self.wf.workflowfile('pandoctor.py'),
+                                         'config'])
+        except (OSError, IOError) as err:
+            # Serving the stored data beats failing the Script Filter
+            self.wf.logger.error('Cannot refresh `pandoc` data : %s', err)
+            return False
+        return not retcode
 
-        stored = self.wf.cached_data(name, wrapper, max_age=0)
 
-        if not stored.has_key(key): # new `key:value` pair
-            stored.update({key: data})
-            self.wf.cache_data(name, stored)
-        else: # update `value` of `key`
-            stored[key] = data
-            self.wf.cache_data(name, stored)
+    def installs(self):
+        """Find every `pandoc` in common prefixes and on ``$PATH``.
+
+        :returns: ``list`` of paths, one per distinct executable
+        """
+        dirs = [os.path.expanduser(d) for d in PANDOC_PREFIXES]
+        dirs.extend(os.environ.get('PATH', '').split(os.pathsep))
+
+        found = []
+        seen = set()
+        for dirpath in dirs:
+            path = os.path.join(dirpath, 'pandoc')
+            realpath = os.path.realpath(path)
+            if realpath not in seen and _is_executable(path):
+                seen.add(realpath)
+                found.append(path)
+        return found
+
+
+    def pin(self, path):
+        """Always use the `pandoc` at ``path``. ``None`` removes the pin.
+        """
+        if path is not None and not _is_executable(path):
+            raise RuntimeError("No pandoc executable at {}!".format(path))
+        self.data['pinned'] = path
+        if path is None:
+            # Resolve afresh rather than keep the previous pin
+            self.data['fingerprint'] = None
+        self._path = None
+        self._probes = {}
+        self.validate()
+        self._save('pinned', 'fingerprint')
+        return True
+
+
+    def rebuild(self, keys, save=()):
+        """Rebuild sections ``keys`` and save them in one write,
+        along with the already updated sections ``save``.
+        """
+        builders = {
+            'outputs': lambda: self._formats('output'),
+            'inputs': lambda: self._formats('input'),
+            'extensions': self._extensions,
+            'options': self._options,
+            'arg_options': self._arg_option_flags,
+            'option_map': lambda: self._option_map(self._arg_option_flags())
+        }
+        version = self.version
+        fresh = dict((key, builders[key]()) for key in keys)
+        for key in [k for k in fresh if k in SEARCH_FIELDS]:
+            fresh[key + '_index'] = self._search_index(fresh[key],
+                                                       SEARCH_FIELDS[key])
+
+        # Merge only once every section has been built
+        self.data.update(fresh)
+        if 'options' in fresh:
+            self._catalog = None
+        self._indexes = {}
+        built = self.data.setdefault('built', {})
+        built.update(dict.fromkeys(fresh, version))
+        self._save(*(['built'] + list(fresh) + list(save)))
         return True
 
 
@@ -217,47 +709,239 @@ class Pandoc(object):
     #-------------------------------------------------------
 
 
+    def _section(self, key):
+        """Get section ``key`` of stored data, rebuilding it if stale.
+        """
+        if key not in self.data and key in self._store:
+            self.data[key] = self._store.load(key)
+
+        built = self.data.get('built') or {}
+        fingerprint = self.data.get('fingerprint') or {}
+        if key in self.data and self._serve_stale:
+            return self.data[key]
+        if key not in self.data or built.get(key) != fingerprint.get('version'):
+            self.wf.logger.debug('Rebuilding stale `pandoc` data : %s', key)
+            self.rebuild([key])
+        return self.data[key]
+
+
+    @staticmethod
+    def _search_index(records, weights):
+        """Storable :class:`FieldIndex` of ``records``.
+        """
+        return {'weights': weights,
+                'fields': FieldIndex(records, weights).fields()}
+
+
     @staticmethod
-    def _formats(kind):
+    def _stat_matches(fingerprint):
+        """Does the binary at the fingerprinted path look unchanged?
+        """
+        try:
+            stat = os.stat(fingerprint['path'])
+        except OSError:
+            return False
+        return (stat.st_ino == fingerprint['inode']
+                and stat.st_mtime == fingerprint['mtime']
+                and stat.st_size == fingerprint['size'])
+
+
+    def _save(self, *keys):
+        """Write sections ``keys`` to ``pandoc.store`` in one go.
+
+        Only pass the sections this process changed: the store keeps
+        the others as they are on disk, even if another process saved
+        them after they were loaded here.
+        """
+        self._store.save(dict((key, self.data[key]) for key in keys
+                              if key in self.data))
+        self.wf.logger.debug('Pandoc data saved at : %s', self._store.path)
+
+
+    def _resolve_path(self):
+        """Pick the `pandoc` executable to use.
+
+        An explicit or pinned path wins, then the fingerprinted path,
+        then the first install found by :meth:`installs`.
+        """
+        wanted = self.wanted_path
+        if wanted:
+            if _is_executable(wanted):
+                return wanted
+            raise RuntimeError("No pandoc executable at {}!".format(wanted))
+
+        fingerprint = self.data.get('fingerprint')
+        if fingerprint and _is_executable(fingerprint['path']):
+            return fingerprint['path']
+
+        installs = self.installs()
+        if installs:
+            return installs[0]
+        raise RuntimeError("Pandoc is not installed!")
+
+
+    def _binary_version(self):
+        """Get version string straight from the `pandoc` binary.
+        """
+        version = self._pandoc_info('--version').splitlines()[0]
+        return version.replace('pandoc ', '').strip()
+
+
+    def _formats(self, kind):
         """Get all possible input and/or output formats for `pandoc`.
         """
+        if self.can_list:
+            return self._binary_formats(kind)
+        return self._readme_formats(kind)
+
+
+    def _binary_formats(self, kind):
+        """Get formats of `kind` from the installed `pandoc` itself.
+        """
+        flag = '--list-{}-formats'.format(kind)
+        names = self._pandoc_info(flag).split()
+        if kind == 'output' and 'pdf' not in names:
+            names.insert(0, 'pdf')
+
+        d_formats = []
+        for name in names:
+            if name == 'pdf':
+                description = 'Portable Document Format'
+            else:
+                description = FORMAT_DESCRIPTIONS.get(name, name)
+            d_formats.append({'arg': name, 'description': description})
+        return d_formats
+
+
+    def _readme_formats(self, kind):
+        """Get formats of `kind` from the online `pandoc` README.
+
+        Only used for `pandoc` versions that cannot list their formats.
+        """
         format_re = re.compile(r'<code>(.*?)</code>\s\((.*?)\)')
-        req = web.request('GET', 'http://johnmacfarlane.net/pandoc/README.html')
-        lines = req.text.splitlines()
-        for i, line in enumerate(lines):
-            if '<dt><code>-f</code>' in line:
-                inputs = re.findall(format_re, lines[i+1])
-            elif '<dt><code>-t</code>' in line:
-                outputs = re.findall(format_re, lines[i+1])
-
-        d_outputs = [{'arg': 'pdf', 'description': 'Portable Document Format'}]
-        for out in outputs:
-            d_outputs.append({'arg': out[0], 'description': out[1]})
-        d_inputs = []
-        for inp in inputs:
-            d_inputs.append({'arg': inp[0], 'description': inp[1]})
+        flag = '-f' if kind == 'input' else '-t'
 
+        # Formats are listed in the first paragraph of the entry
+        paragraph = self._readme().formats.get(flag, '')
+        formats = re.findall(format_re, paragraph)
+
+        d_formats = []
         if kind == 'output':
-            return d_outputs
-        elif kind == 'input':
-            return d_inputs
+            d_formats.append({'arg': 'pdf',
+                              'description': 'Portable Document Format'})
+        for fmt in formats:
+            d_formats.append({'arg': fmt[0], 'description': fmt[1]})
+        return d_formats
+
+
+    def _readme(self):
+        """Get the parsed `pandoc` README, fetching it at most once.
+
+        The page is cached with its ``ETag`` and ``Last-Modified``
+        headers, so later fetches are conditional requests.
+        """
+        if self._readme_doc is not None:
+            return self._readme_doc
+
+        stored = self.wf.cached_data('readme', max_age=0) or {}
+        headers = {}
+        if 'text' in stored:
+            if stored.get('etag'):
+                headers['If-None-Match'] = stored['etag']
+            if stored.get('last_modified'):
+                headers['If-Modified-Since'] = stored['last_modified']
+
+        req = web.get(README, headers=headers)
+        if req.status_code == 304 and 'text' in stored:
+            self.wf.logger.debug('README not modified since last fetch')
+            text = stored['text']
+        else:
+            req.raise_for_status()
+            text = req.text
+            self.wf.cache_data('readme', {
+                'etag': req.headers.get('etag'),
+                'last_modified': req.headers.get('last-modified'),
+                'text': text
+            })
+
+        self._readme_doc = parse_readme(text)
+        return self._readme_doc
 
 
     def _pandoc_info(self, flag):
         """Get man/help page for `pandoc`.
+
+        Output is remembered per flag, so a probe run by :meth:`config`
+        is never spawned twice, even from concurrent threads.
         """
+        with self._probe_lock:
+            lock = self._probe_locks.setdefault(flag, threading.Lock())
+        with lock:
+            if flag not in self._probes:
+                try:
+                    output = subprocess.check_output([self.path, flag])
+                except OSError:
+                    raise OSError("You probably do not have pandoc installed.")
+                self._probes[flag] = output.decode('utf-8')
+        return self._probes[flag]
+
+
+    def _collect(self, probes):
+        """Run independent ``probes`` at once in a bounded thread pool.
+
+        Failed probes are logged and left for their consumer to retry.
+
+        :param probes: ``dict`` of ``{name: callable}``
+        :returns: ``dict`` of ``{name: seconds taken}``
+        """
+        def timed(name):
+            start = time.time()
+            try:
+                probes[name]()
+            except Exception as err:
+                self.wf.logger.debug('Probe `%s` failed : %s', name, err)
+            return name, time.time() - start
+
+        pool = ThreadPool(min(PROBE_WORKERS, len(probes)))
         try:
-            return subprocess.check_output([self.path, flag]).decode()
-        except OSError:
-            raise OSError("You probably do not have pandoc installed.")
+            timings = dict(pool.map(timed, probes))
+        finally:
+            pool.close()
+            pool.join()
+
+        for name, secs in sorted(timings.items(), key=lambda t: -t[1]):
+            self.wf.logger.info('Probe `%s` took %.3fs', name, secs)
+        return timings
+
+
+    def _help_lines(self):
+        """Get the option lines of `pandoc --help`.
+        """
+        man_page = self._pandoc_info('--help').splitlines(False)
+        # Newer versions drop the `Options:` heading
+        if 'Options:' in man_page:
+            idx = man_page.index('Options:') + 1
+        else:
+            idx = 1
+        return [line for line in man_page[idx:] if '--' in line]
+
+
+    def _extensions(self):
+        """Get all possible format extensions for `pandoc`.
+        """
+        if not self.can_list:
+            return []
+        exts = []
+        for line in self._pandoc_info('--list-extensions').split():
+            exts.append({'flag': line[1:],
+                         'status': line.startswith('+')})
+        return exts
 
 
     def _options(self):
         """Get all possible options for `pandoc`.
         """
-        man_page = self._pandoc_info('--help').splitlines(False)
-        idx = man_page.index('Options:') + 1
-        options = man_page[idx:]
+        options = self._help_lines()
         args = []
         for option in options:
             long_option = re.search(r'--(.*?)(?=\s|,)', option).group()
@@ -295,27 +979,59 @@ class Pandoc(object):
         return args
 
 
-    @staticmethod
-    def _arg_option_flags():
+    def _arg_option_flags(self):
         """Get short and long form of all `pandoc` argument options.
         """
-        # Soupify the HTML of pandoc README
-        req = web.get('http://johnmacfarlane.net/pandoc/README.html')
-        req.raise_for_status()
-        soup = BeautifulSoup(req.text)
+        if self.can_list:
+            return self._help_arg_options()
+        return self._readme_arg_options()
+
+
+    @staticmethod
+    def _option_map(arg_options):
+        """Map every form of each argument option to its long form.
+
+        E.g. ``-r``, ``--read`` and ``--from`` all map to ``--from``.
+        Optional arguments are dropped too: ``--list-extensions[=FORMAT]``
+        maps to ``--list-extensions``.
+        """
+        def bare(form):
+            return form.split(' ')[0].split('[')[0].split('=')[0]
+
+        option_map = {}
+        for item in arg_options:
+            forms = item.split(', ')
+            # Get the long-form option format
+            full_opt = next((o for o in forms if ' ' not in o), None)
+            if full_opt is None:
+                continue
+            opt_flag = bare(full_opt)
+            for form in forms:
+                option_map.setdefault(bare(form), opt_flag)
+        return option_map
+
 
+    def _help_arg_options(self):
+        """Get argument options from `pandoc --help`.
+
+        Each item matches the README format, e.g.
+        ``-f FORMAT, -r FORMAT, --from=FORMAT, --read=FORMAT``.
+        """
         cli_arg_options = []
-        # Get all the sub-sections under "Options"
-        option_types = soup.find_all('dl')
-        for option_set in option_types:
-            # Get all the options under that sub-section
-            options = option_set.find_all('dt')
-            for opt in options:
-                if '=' in opt.text:
-                    cli_arg_options.append(opt.text)
+        for line in self._help_lines():
+            if '=' in line:
+                forms = re.split(r',\s+|\s{2,}', line.strip())
+                cli_arg_options.append(', '.join(f for f in forms if f))
         return cli_arg_options
 
 
+    def _readme_arg_options(self):
+        """Get argument options from the online `pandoc` README.
+        """
+        # Every option term in the sub-sections under "Options"
+        return [term for term in self._readme().terms if '=' in term]
+
+
 ################################################################################
 #     Pandoctor Object
 ################################################################################
@@ -325,9 +1041,13 @@ class PanDoctor(object):
     def __init__(self, wf):
         self.wf = wf
         self.runner = self.wf.cached_data('runner', max_age=0)
-        self.pandoc = Pandoc(wf)
+        self.pandoc = Pandoc(wf, revalidate=False)
+        self.prefs = UserPrefs(wf)
+        self.cache = CacheManager(wf, CACHE_NAMESPACES)
+        self.refreshing = False
         self.flag = None
         self.arg = None
+        self._plan = None
 
 
 #-----------------------------------------------------------------
@@ -349,6 +1069,14 @@ class PanDoctor(object):
 
         for action in actions:
             if args.get(action):
+                # Never make a Script Filter wait on `pandoc`
+                if action == 'search':
+                    max_age = self.wf.settings.get('pandoc_max_age',
+                                                   PANDOC_MAX_AGE)
+                    self.refreshing = self.pandoc.refresh_in_background(max_age)
+                else:
+                    self.pandoc.validate()
+
                 method_name = '{}_codepath'.format(action)
                 method = getattr(self, method_name, None)
                 if method:
@@ -368,7 +1096,7 @@ class PanDoctor(object):
         if self.flag == 'filter':
             self.help_filter()
         else:
-            self.help_run()
+            return self.help_run()
 
 
     #---------------------------------------------
@@ -403,6 +1131,38 @@ class PanDoctor(object):
                         "Open Pandoctor's Logs?", 
                         valid=True, 
                         arg='workflow:openlog')
+
+        # How much each kind of cached data takes and how often it's used
+        usage = self.cache.usage()
+        stats = self.cache.stats()
+        for name in [ns[0] for ns in CACHE_NAMESPACES] + [OTHER]:
+            files, size = usage.get(name, (0, 0))
+            hits, misses = stats.get(name, (0, 0))
+            if not files and not hits + misses:
+                continue
+            if files:
+                sub = "{} in {} file{}".format(utils.to_size(size), files,
+                                               '' if files == 1 else 's')
+            else:
+                sub = "No files"
+            if hits + misses:
+                sub += ", {:.0%} of {:,} reads hit".format(
+                    float(hits) / (hits + misses), hits + misses)
+            self.wf.add_item("Cache: " + name, sub)
+
+        # Let user pick which `pandoc` to use
+        pinned = self.pandoc.data.get('pinned')
+        for path in self.pandoc.installs():
+            if path == pinned:
+                sub = "Pinned. Select to stop pinning this pandoc?"
+                arg = 'pin:'
+            else:
+                sub = "Always use this pandoc?"
+                arg = 'pin:' + path
+            self.wf.add_item("Pandoc at " + path,
+                             sub,
+                             valid=True,
+                             arg=arg)
         
         self.wf.send_feedback()
 
@@ -411,7 +1171,10 @@ class PanDoctor(object):
         """Launch various help items.
         """
         # Workflow will take care of all other help items
-        if self.flag == 'dr:readme':
+        if self.flag.startswith('pin:'):
+            self.pandoc.pin(self.flag[4:] or None)
+            return "Pandoc pinned!" if self.flag[4:] else "Pandoc unpinned!"
+        elif self.flag == 'dr:readme':
             readme = 'http://hackademic.postach.io/pandoctor-alfred-workflow'
         elif self.flag == 'p:readme':
             readme = self.wf.workflowfile('help/pandoc_readme.html')
@@ -438,8 +1201,12 @@ class PanDoctor(object):
     def search_codepath(self):
         """Search/Show data for given scope.
         """
-        prop = 'options' if self.flag in ('ignore', 'default') else self.flag
-        data = getattr(self.pandoc, prop, None)
+        if self.flag in ('options', 'ignore', 'default'):
+            data = self.pandoc.search_index('options')
+        elif self.flag in ('inputs', 'outputs'):
+            data = self.pandoc.search_index(self.flag)
+        else:
+            data = getattr(self.pandoc, self.flag, None)
 
         # Ensure each Script Filter has informational header
         self._add_header()
@@ -474,12 +1241,12 @@ class PanDoctor(object):
     def search_formats(self, data):
         """Search `input` or `output` formats.
         """
-        res = self._filter(data, lambda x: ' '.join([x['arg'], x['description']]))
+        res = self._filter(data)
         
         # Prepare Alfred feedback
         for item in res:
             self.wf.add_item(item['arg'],
-                             item['description'],
+                             self._subtitle(item['description']),
                              arg=item['arg'],
                              valid=True)
 
@@ -487,43 +1254,39 @@ class PanDoctor(object):
     def search_options(self, data):
         """Search `options`.
         """
-        results = self._filter(data, lambda x: ' '.join([x['full'], x['type']]))
+        results = self._filter(data, exclude=self._hidden())
 
         # Get all option keys already assigned
-        runner_opts = []
+        runner_opts = set()
         if self.runner is not None:
-            runner_opts = [k for k in self.runner.keys()
-                            if k not in RUNNER_KEYS]
+            runner_opts = set(self.runner) - set(RUNNER_KEYS)
         
+        defs = self.prefs.defaults
+
         # Prepare Alfred feedback
         for item in results:
-            if self._check_option(item) == False:
-                continue
+            status = item.status
 
             # Check for user defaults
             # and change status accordingly
-            if os.path.exists(self.wf.datafile('user_defaults.json')):
-                item['status'] = False
-                defs = utils.json_read(self.wf.datafile('user_defaults.json'))
-                if item['flag'] in defs:
-                    item['status'] = True
+            if defs is not None:
+                status = item.flag in defs
 
             # Catch any pre-set options
-            if item['flag'] in runner_opts:
+            if item.flag in runner_opts:
                 # get item's pre-set status value
-                item['status'] = next((val for key, val in self.runner.items()
-                                    if key == item['flag']), None)
+                status = self.runner[item.flag]
 
             # Prepare item subtitle and icon
-            subtitle = 'Type: {}'.format(item['type'])
+            subtitle = self._subtitle('Type: {}'.format(item.type))
             icon = 'icons/pandoc.png'
-            if item['status'] != False:
+            if status != False:
                 icon = 'icons/pandoc_on.png'
 
             # Add item to Alfred results
-            self.wf.add_item(item['flag'],
+            self.wf.add_item(item.flag,
                              subtitle,
-                             arg=item['flag'],
+                             arg=item.flag,
                              valid=True,
                              icon=icon)
 
@@ -531,30 +1294,27 @@ class PanDoctor(object):
     def search_ignores(self, data):
         """Search thru options user wants to ignore.
         """
-        results = self._filter(data, lambda x: ' '.join([x['full'], x['type']]))
+        results = self._filter(data, exclude=self._hidden(ignored=False))
 
-        ignored_opts = utils.json_read(self.wf.datafile('user_ignore.json'))
+        ignored_opts = self.prefs.ignored
         
         # Prepare Alfred feedback
         for item in results:
             icon = 'icons/pandoc.png'
             
-            # Ignore user chosen ignored_opts options
-            if item['flag'] in ('to', 'from'):
-                continue
-            
-            elif (ignored_opts is not None 
-                    and item['flag'] in ignored_opts
+            # Mark user chosen ignored_opts options
+            if (ignored_opts is not None 
+                    and item.flag in ignored_opts
                  ):
                 icon = 'icons/pandoc_on.png'
 
             # Prepare item subtitle and icon
-            subtitle = 'Type: {}'.format(item['type'])
+            subtitle = self._subtitle('Type: {}'.format(item.type))
 
             # Add item to Alfred results
-            self.wf.add_item(item['flag'],
+            self.wf.add_item(item.flag,
                         subtitle,
-                        arg=item['flag'],
+                        arg=item.flag,
                         valid=True,
                         icon=icon)
 
@@ -562,30 +1322,27 @@ class PanDoctor(object):
     def search_defaults(self, data):
         """Search through options to set as default.
         """
-        results = self._filter(data, lambda x: ' '.join([x['full'], x['type']]))
+        results = self._filter(data, exclude=self._hidden(ignored=False))
 
-        default_opts = utils.json_read(self.wf.datafile('user_defaults.json'))
+        default_opts = self.prefs.defaults
         
         # Prepare Alfred feedback
         for item in results:
             icon = 'icons/pandoc.png'
             
-            # Ignore user chosen default_opts options
-            if item['flag'] in ('to', 'from'):
-                continue
-            
-            elif (default_opts is not None 
-                    and item['flag'] in default_opts
+            # Mark user chosen default_opts options
+            if (default_opts is not None 
+                    and item.flag in default_opts
                  ):
                 icon = 'icons/pandoc_on.png'
 
             # Prepare item subtitle and icon
-            subtitle = 'Type: {}'.format(item['type'])
+            subtitle = self._subtitle('Type: {}'.format(item.type))
 
             # Add item to Alfred results
-            self.wf.add_item(item['flag'],
+            self.wf.add_item(item.flag,
                         subtitle,
-                        arg=item['flag'],
+                        arg=item.flag,
                         valid=True,
                         icon=icon)
 
@@ -593,12 +1350,8 @@ class PanDoctor(object):
     def search_templates(self):
         """Display the names of all the user's Pandoc Templates.
         """
-        tmps = utils.json_read(self.wf.datafile('user_templates.json'))
-        if not tmps:
-            # Show default Templates if no user ones created
-            tmps = utils.json_read(self.wf.workflowfile('pandoc_templates.json'))
-
-        results = self._filter(tmps, lambda x: x['name'])
+        # Show default Templates if no user ones created
+        results = self._filter(self.prefs.template_index)
         
         # Prepare Alfred feedback
         for item in results:
@@ -614,7 +1367,7 @@ class PanDoctor(object):
         """Display ``True`` and ``False`` as options.
         """
         booleans = ('True', 'False')
-        results = self._filter(booleans, lambda x: x)
+        results = self._filter(booleans)
         
         # Prepare Alfred feedback
         for item in results:
@@ -664,32 +1417,90 @@ class PanDoctor(object):
                          icon=header_icon)
 
 
-    def _check_option(self, item):
-        """Determine if item should be passed on or not.
+    def _subtitle(self, text):
+        """Mark ``text`` while `pandoc` data is being refreshed.
         """
-        # Get all options user wants ignored
-        ignored_opts = utils.json_read(self.wf.datafile('user_ignore.json'))
-        
-        # Ignore `input` and `output` options
-        # or ignore any user selected ignore options
-        if (item['flag'] in ('to', 'from')
-             or
-                (ignored_opts is not None 
-                  and item['flag'] in ignored_opts
-                )
-            ):
-            return False
-        else:
-            return True
+        if self.refreshing:
+            return text + ' (refreshing…)'
+        return text
 
 
-    def _filter(self, data, func):
+    def _hidden(self, ignored=True):
+        """Test for options a search leaves out, for ``_filter``.
+
+        `to` and `from` are always left out, as are the options the
+        user wants ignored unless ``ignored`` is ``False``.
+        """
+        hidden = set(('to', 'from'))
+        if ignored:
+            hidden.update(self.prefs.ignored)
+        return lambda item: item.flag in hidden
+
+
+    @property
+    def query_plan(self):
+        """User's query, prepared once for every search of this run.
+        """
+        if self._plan is None:
+            self._plan = self.wf.query_plan(self.arg or '',
+                                            match_on=MATCH_RULES)
+        return self._plan
+
+
+    def _filter(self, data, func=lambda x: x, exclude=None):
         """Use ``Workflow``'s ``filter`` method.
+
+        ``data`` may be a :class:`FieldIndex`, making ``func`` redundant.
+        Items for which ``exclude`` returns ``True`` are left out, then
+        only the best :data:`MAX_RESULTS` matches are returned.
+
+        The positions of every item that can match the query or an
+        extension of it are kept in ``filter_state.cache``. When the next
+        keystroke extends the query, only those items are searched. They
+        include more than the matches: a long key may score nothing
+        against a short query, yet match a longer one.
         """
-        results = self.wf.filter(self.arg, data,
-                                key=func, 
-                                match_on=MATCH_ALL ^ MATCH_ALLCHARS)
-        return results
+        plan = self.query_plan
+        if plan.empty:
+            results = self.wf.filter(plan, data, key=func)
+            if exclude is not None:
+                results = [item for item in results if not exclude(item)]
+            return results
+
+        query = plan.query
+        if not isinstance(data, FieldIndex):
+            data = FieldIndex(data, ((func, 1.0),))
+        signature = (self.flag, plan.match_on, plan.fold_diacritics, len(data),
+                     data.signature())
+
+        # Folding differs per word for non-ASCII queries: start afresh
+        state = self.wf.cached_data('filter_state', max_age=FILTER_STATE_TTL)
+        if (state and state['signature'] == signature and isascii(query)
+                and query.startswith(state['query'])):
+            positions = state['positions']
+            self.wf.logger.debug('Refining %d candidates of `%s`',
+                                 len(positions), state['query'])
+        else:
+            positions = range(len(data))
+
+        # Items that can match this query or an extension of it. Stored
+        # before exclusions, which may change between keystrokes.
+        subset = data.subset(positions)
+        positions = [subset.items[i] for i in subset.containing(plan)]
+        # Read on every keystroke and only built-in types: marshal it
+        self.wf.cache_data('filter_state', {
+            'signature': signature,
+            'query': query,
+            'positions': positions
+        }, serializer='marshal')
+
+        # Exclude before picking the best, so excluded items take no slot
+        if exclude is not None:
+            positions = [i for i in positions if not exclude(data.items[i])]
+        # Matches are positions, as the subset's items are
+        matches = self.wf.filter(plan, data.subset(positions),
+                                 max_results=MAX_RESULTS)
+        return [data.items[i] for i in matches]
 
 
 #-------------------------------------------------------
@@ -779,13 +1590,7 @@ class PanDoctor(object):
         if self.arg == '[done]':
             arg_out = '[pause]'
         else:
-            ignored = utils.json_read(self.wf.datafile('user_ignore.json'))
-            if ignored:
-                ignored.extend([value])
-                clean = list(set(ignored))
-                utils.json_write(clean, self.wf.datafile('user_ignore.json'))
-            else:
-                utils.json_write([value], self.wf.datafile('user_ignore.json'))
+            self.prefs.add_ignore(value)
 
         return arg_out
 
@@ -799,13 +1604,7 @@ class PanDoctor(object):
         if self.arg == '[done]':
             arg_out = '[pause]'
         else:
-            defaults = utils.json_read(self.wf.datafile('user_defaults.json'))
-            if defaults:
-                defaults.extend([value])
-                clean = list(set(defaults))
-                utils.json_write(clean, self.wf.datafile('user_defaults.json'))
-            else:
-                utils.json_write([value], self.wf.datafile('user_defaults.json'))
+            self.prefs.add_default(value)
 
         return arg_out
 
@@ -852,7 +1651,8 @@ class PanDoctor(object):
     def _store_template_info(self, key, value):
         """Store dictionary info for new user template.
         """
-        tmps = utils.json_read(self.wf.datafile('user_templates.json'))
+        # Copy, as :class:`UserPrefs` keeps the parsed file
+        tmps = [dict(temp) for temp in self.prefs.user_templates or ()]
         if tmps:
             if key == 'name':
                 d = [{key: value}]
@@ -866,7 +1666,7 @@ class PanDoctor(object):
         else:
             new = [{key: value}]
 
-        utils.json_write(new, self.wf.datafile('user_templates.json'))
+        self.prefs.save_templates(new)
         return True
 
 
@@ -887,73 +1687,51 @@ class PanDoctor(object):
     def _flip_value(self, option):
         """Return only options of specified type.
         """
-        runner_opts = [k for k in self.runner.keys() if k not in RUNNER_KEYS]
-        if option not in runner_opts:
-            gen_exp = (opt for opt in self.pandoc.options
-                        if opt['flag'] == option)
-            dct = next(gen_exp, None)
-            return not dct['status']
+        runner = self.runner or {}
+        if option in RUNNER_KEYS or option not in runner:
+            return not self.pandoc.catalog.get(option).status
         else:
-            gen_exp = (val for key, val in self.runner.items()
-                        if key == option)
-            val = next(gen_exp, None)
-            return not val
+            return not runner[option]
 
 
     def _is_boolean_option(self, option):
         """Check if option is Boolean.
         """
-        dct = [opt for opt in self.pandoc.options 
-                if opt['flag'] == option
-                and opt['arg_type'] == None]
-        if dct != []:
-            return True
-        else:
-            return False
+        opt = self.pandoc.catalog.get(option)
+        return opt is not None and opt.is_boolean
 
     # TODO
     def _parse_template(self, cmd):
         """Parse a normal `pandoc` command into a proper Pandoctor command.
         """
-        pandoc_re = r'(--|-[^\s]*?)\s([^-](?:[^\s]*?".*?"|[^\s]*?))(?=\s|$)'
-        arg_options = re.findall(pandoc_re, cmd)
-        data = self.pandoc.arg_options
-
-        # Iterate thru possible short-form option + arg items
-        for arg_opt in arg_options:
-            search_str = ' '.join(arg_opt)
+        option_map = self.pandoc.option_map
 
-            # Prepare `flag` for precise searching
-            flag = arg_opt[0] if '--' in arg_opt[0] else arg_opt[0] + ' '
-            long_opt = next((item for item in data if flag in item), None)
+        def long_form(match):
+            """Rewrite one option + arg item in long form.
+            """
+            arg_opt = match.groups()
+            opt_flag = option_map.get(arg_opt[0])
 
             # Is there a possible long-form option?
-            if long_opt is not None:
-                re_opts = long_opt.split(', ')
-                
-                # Get the long-form option format
-                full_opt = next((o for o in re_opts if ' ' not in o), None)
-                opt_flag = full_opt.split('=')[0]
-               
-                # Prepare and format the arg for the long-form option
-                if '.' in arg_opt[1]: # is it a file?
-                    if opt_flag == '--output':
-                        input_ext = os.path.splitext(arg_opt[1])[1]
-                        replace_path = "{input_name}" + input_ext
-                        replace_str = '='.join([opt_flag, replace_path])
-                    else:
-                        replace_path = '{input_dir}/' + arg_opt[1]
-                        replace_str = '='.join([opt_flag, replace_path])
+            if opt_flag is None:
+                return match.group(0)
+
+            # Prepare and format the arg for the long-form option
+            if '.' in arg_opt[1]: # is it a file?
+                if opt_flag == '--output':
+                    input_ext = os.path.splitext(arg_opt[1])[1]
+                    replace_path = "{input_name}" + input_ext
                 else:
-                    the_arg = arg_opt[1]
-                    if '=' in arg_opt[1]:
-                        the_arg = arg_opt[1].replace('=', ':')
-                        
-                    replace_str = '='.join([opt_flag, the_arg])
-            else: # no long-form option
-                replace_str = search_str
+                    replace_path = '{input_dir}/' + arg_opt[1]
+                return '='.join([opt_flag, replace_path])
+            else:
+                the_arg = arg_opt[1]
+                if '=' in arg_opt[1]:
+                    the_arg = arg_opt[1].replace('=', ':')
+                return '='.join([opt_flag, the_arg])
 
-            cmd = re.sub(search_str, replace_str, cmd)
+        # Rewrite all possible short-form option + arg items in one pass
+        cmd = PANDOC_ARG_RE.sub(long_form, cmd)
 
         # Split options into list
         cmd_list = self._splitter(cmd)
@@ -1049,17 +1827,14 @@ class PanDoctor(object):
     def run_template_cmd(self, template):
         """Run user-selected template command.
         """
-        tmps = utils.json_read(self.wf.datafile('user_templates.json'))
-        if tmps == None:
-            tmps = utils.json_read(self.wf.workflowfile('pandoc_templates.json'))
+        tmps = self.prefs.templates
 
         for temp in tmps:
             if temp['name'] == template.strip():
-                args = temp['options']
+                args = list(temp['options'])
 
                 if temp['use_defaults'] == True:
-                    defaults = [opt['full'] for opt in self.pandoc.options
-                                if opt['status'] == True]
+                    defaults = [opt.full for opt in self.pandoc.catalog.defaults]
                     args.extend(defaults)
 
                 args = self._format_template(args)
@@ -1130,21 +1905,19 @@ class PanDoctor(object):
     def _get_options(self):
         """Get all chosen options.
         """
-        runner_opts = [k for k in self.runner.keys() if k not in RUNNER_KEYS]
-
         on_opts = []
-        for opt in self.pandoc.options:
-            if opt['flag'] in ('to', 'from'):
+        for opt in self.pandoc.catalog:
+            status = opt.status
+            if opt.flag in ('to', 'from'):
                 continue
             # Catch any pre-set options
-            elif opt['flag'] in runner_opts:
-                opt['status'] = next((val for key, val in self.runner.items()
-                                        if key == opt['flag']), None)
+            elif opt.flag in self.runner and opt.flag not in RUNNER_KEYS:
+                status = self.runner[opt.flag]
             
-            if opt['status'] == True:
-                on_opts.append(opt['full'])
-            elif opt['status'] != False:
-                arg_opt = "--{}={}".format(opt['flag'], opt['status'])
+            if status == True:
+                on_opts.append(opt.full)
+            elif status != False:
+                arg_opt = "--{}={}".format(opt.flag, status)
                 on_opts.append(arg_opt)
 
         # Check if explicit output file is specified
@@ -1165,8 +1938,7 @@ class PanDoctor(object):
     def _runner_val(self, key):
         """Get the value for ``key`` from ``runner.cache``.
         """
-        val = next((v for k, v in self.runner.items() if k == key), None)
-        return val
+        return self.runner.get(key)
 
 
     def _format_template(self, args):
@@ -1206,6 +1978,7 @@ def main(wf):
     wf.logger.debug(args)
     pd = PanDoctor(wf)
     res = pd.run(args)
+    pd.cache.sweep_if_due()
     if res:
         print res.strip()
 
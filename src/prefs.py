@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright © 2014 stephen.margheim@gmail.com
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 16-10-2026
+#
+from __future__ import unicode_literals
+
+# Standard Library
+import os
+
+# Workflow Library
+import utils
+from workflow.workflow import FieldIndex, LockFile
+
+# User preference files within the workflow's data dir
+PREF_FILES = {
+    'ignore': 'user_ignore.json',
+    'defaults': 'user_defaults.json',
+    'templates': 'user_templates.json'
+}
+
+# Preferences that are lists of option flags
+FLAG_PREFS = ('ignore', 'defaults')
+
+
+###########################################################################
+# User preferences                                                        #
+###########################################################################
+
+class UserPrefs(object):
+    """User's ignored options, default options and templates.
+
+    Each file is parsed at most once per process and re-read only if
+    its mtime or size changes. Writes replace the file atomically and
+    additions hold the file's lock from read to write.
+
+    :param wf: :class:`workflow.Workflow` instance
+    """
+
+    def __init__(self, wf):
+        self.wf = wf
+        self._cache = {}
+        self._index = None
+
+    @property
+    def ignored(self):
+        """``frozenset`` of options the user wants ignored"""
+
+        return self._flags('ignore') or frozenset()
+
+    @property
+    def defaults(self):
+        """``frozenset`` of the user's default options or ``None`` if
+        the user has not chosen any, i.e. `pandoc`'s defaults apply."""
+
+        return self._flags('defaults')
+
+    @property
+    def user_templates(self):
+        """``list`` of the user's own templates or ``None``"""
+
+        return self._read('templates')
+
+    @property
+    def templates(self):
+        """User's templates, or the bundled ones if there are none"""
+
+        templates = self.user_templates
+        if not templates:
+            templates = utils.json_read(
+                self.wf.workflowfile('pandoc_templates.json'))
+        return templates
+
+    @property
+    def template_index(self):
+        """:class:`FieldIndex` of :attr:`templates` by name"""
+
+        templates = self.templates
+        if self._index is None or self._index.items is not templates:
+            self._index = FieldIndex(templates, (('name', 1.0),))
+        return self._index
+
+    def add_ignore(self, flag):
+        """Add ``flag`` to ignored options"""
+
+        return self._add('ignore', flag)
+
+    def add_default(self, flag):
+        """Add ``flag`` to default options"""
+
+        return self._add('defaults', flag)
+
+    def save_templates(self, templates):
+        """Replace the user's templates with ``templates``"""
+
+        return self._write('templates', templates)
+
+    def _add(self, name, value):
+        """Add ``value`` to list preference ``name``"""
+
+        # Another run adding at the same time must not lose our value
+        with LockFile(self.wf.datafile(PREF_FILES[name])):
+            values = set(self._read(name) or ())
+            values.add(value)
+            return self._write(name, sorted(values), lock=False)
+
+    def _read(self, name):
+        """Get contents of preference file ``name``, parsing it only
+        when it changed since last read."""
+
+        cached = self._load(name)
+        return cached and cached[1]
+
+    def _flags(self, name):
+        """``frozenset`` of flag preference ``name`` or ``None``"""
+
+        cached = self._load(name)
+        return cached and cached[2]
+
+    def _load(self, name):
+        """``(version, data, flags)`` of preference file ``name`` or
+        ``None`` if it does not exist. ``flags`` is ``data`` as a
+        ``frozenset`` for :const:`FLAG_PREFS`, built once per version."""
+
+        path = self.wf.datafile(PREF_FILES[name])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        version = (stat.st_mtime, stat.st_size)
+        cached = self._cache.get(name)
+        if cached is None or cached[0] != version:
+            cached = self._entry(name, version, utils.json_read(path))
+        return cached
+
+    def _write(self, name, data, lock=True):
+        """Atomically save ``data`` to preference file ``name``"""
+
+        path = self.wf.datafile(PREF_FILES[name])
+        utils.json_write(data, path, lock=lock)
+        stat = os.stat(path)
+        self._entry(name, (stat.st_mtime, stat.st_size), data)
+        return True
+
+    def _entry(self, name, version, data):
+        """Cache ``data`` of preference file ``name`` at ``version``"""
+
+        flags = None
+        if name in FLAG_PREFS and data is not None:
+            flags = frozenset(data)
+        self._cache[name] = (version, data, flags)
+        return self._cache[name]
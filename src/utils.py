@@ -16,6 +16,9 @@ import json
 import os
 import re
 
+# Workflow Library
+from workflow.workflow import LockFile, atomic_writer
+
 # Regular expression for JSON comments
 JSON_COMMENT_RE = re.compile(
     r'(^)?[^\S\n]*/(?:\*(.*?)\*/[^\S\n]*|/[^\n]*)($)?',
@@ -58,18 +61,24 @@ def json_read(path, encoding='utf-8'):
         open(path, 'w')
         return None
 
-def json_write(data, path):
-    """Write `data` to `path` as formatted JSON string"""
+def json_write(data, path, lock=True):
+    """Write `data` to `path` as formatted JSON string.
+    The file is replaced atomically, so readers never see half of it,
+    and concurrent writers take turns. Pass `lock=False` if the caller
+    already holds `LockFile(path)`.
+    """
 
     formatted_json = json.dumps(data, 
                                 sort_keys=False, 
                                 indent=4, 
                                 separators=(',', ': '))
     u_json = to_unicode(formatted_json)
-    with open(path, 'w') as file_obj:
-        file_obj.write(u_json.encode('utf-8'))
-        file_obj.close()
-    return True
+    if not lock:
+        with atomic_writer(path) as file_obj:
+            file_obj.write(u_json.encode('utf-8'))
+        return True
+    with LockFile(path):
+        return json_write(data, path, lock=False)
 
 def path_read(path, encoding='utf-8'):
     """Read data from `path`"""
@@ -111,6 +120,17 @@ def to_bool(text):
     elif str(text).lower() in ('false', 'f', '0'):
         return False
 
+def to_size(num_bytes):
+    """Convert a number of bytes to a short readable size"""
+
+    for unit in ('bytes', 'KB', 'MB'):
+        if num_bytes < 1024 or unit == 'MB':
+            break
+        num_bytes /= 1024.0
+    if unit == 'bytes':
+        return '{:,} bytes'.format(num_bytes)
+    return '{:.1f} {}'.format(num_bytes, unit)
+
 ###########################################################################
 # Applescript functions                                                   #
 ###########################################################################
@@ -211,7 +211,7 @@ def run_in_background(name, args, **kwargs):
         pickle.dump({'args': args, 'kwargs': kwargs}, file)
 
     # Call this script
-    cmd = ['/usr/bin/python', __file__, name]
+    cmd = [sys.executable, __file__, name]
     log.debug('Calling {!r} ...'.format(cmd))
     retcode = subprocess.call(cmd)
     if retcode:  # pragma: no cover
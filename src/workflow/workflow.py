@@ -28,14 +28,27 @@ import subprocess
 import unicodedata
 import shutil
 import json
+import heapq
 import pickle
+import cPickle
+import marshal
+import struct
+import itertools
+import collections
+import multiprocessing
+import tempfile
 import time
 import logging
 import logging.handlers
+from contextlib import contextmanager
 try:
     import xml.etree.cElementTree as ET
 except ImportError:  # pragma: no cover
     import xml.etree.ElementTree as ET
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 
 ####################################################################
@@ -383,6 +396,20 @@ INITIALS = string.ascii_uppercase + string.digits
 # Split on non-letters, numbers
 split_on_delimiters = re.compile('[^a-zA-Z0-9]').split
 
+# Bit of each lower-case ASCII letter and digit in a character mask
+CHAR_BITS = dict((c, 1 << i) for i, c in
+                 enumerate(string.ascii_lowercase + string.digits))
+
+# Items `Workflow.filter` scores in-process before deciding whether a
+# process pool would be faster for the rest
+PARALLEL_SAMPLE = 1000
+
+# Seconds before the measured cost of a process pool is measured again
+POOL_OVERHEAD_AGE = 7 * 24 * 60 * 60
+
+# What pool workers need, inherited when they are forked
+_pool_state = None
+
 # Match filter flags
 MATCH_STARTSWITH = 1
 MATCH_CAPITALS = 2
@@ -395,6 +422,17 @@ MATCH_ALLCHARS = 64
 MATCH_ALL = 127
 
 
+####################################################################
+# Used by `Workflow.cached_data`
+####################################################################
+
+# Bytes at the start of a cache file `SerializerManager.detect` looks at
+SNIFF_SIZE = 4
+
+# Tells data missing from `read_cache` apart from cached ``None``
+_MISSING = object()
+
+
 ####################################################################
 # Keychain access errors
 ####################################################################
@@ -443,10 +481,480 @@ def isascii(text):
     return True
 
 
+def _pool_matches(span):
+    """Score items ``span[0]`` to ``span[1]`` of the inherited
+    :class:`SearchIndex` in a pool worker
+
+    :returns: ``list`` of ``(sort key, score, rule)``
+
+    """
+    wf, index, plan, max_results = _pool_state
+    matches = wf._matches(index, plan, *span)
+    if max_results:
+        return heapq.nsmallest(max_results, matches)
+    return list(matches)
+
+
+def char_mask(text):
+    """Characters of lower-case ``text`` as an ``int`` bitmask of ASCII
+    letters and digits plus a ``frozenset`` of all other characters
+
+    :param text: text to get characters of
+    :type text: ``unicode``
+    :returns: ``(mask, rest)``
+    :rtype: ``tuple``
+
+    """
+    mask = 0
+    rest = []
+    for c in set(text):
+        bit = CHAR_BITS.get(c)
+        if bit:
+            mask |= bit
+        else:
+            rest.append(c)
+    return (mask, frozenset(rest))
+
+
+def match_allchars(text, query):
+    """Find the characters of ``query`` in ``text``, in order.
+
+    Characters are matched as early as possible and, like ``.`` in a
+    regular expression, the gaps between them never span a newline.
+    This is the match of the ``.*?a.*?b.*?c`` pattern this replaces,
+    found with one :meth:`unicode.find` per character.
+
+    :param text: lower-case text to search
+    :type text: ``unicode``
+    :param query: lower-case characters to find
+    :type query: ``unicode``
+    :returns: ``(start, end)`` of the match or ``None``. ``start`` is
+        the start of a line; ``end`` is just past the last character.
+    :rtype: ``tuple``
+
+    """
+    if '\n' not in text:
+        pos = 0
+        for c in query:
+            pos = text.find(c, pos) + 1
+            if not pos:
+                return None
+        return (0, pos)
+
+    # Only try line starts: a match from within a line is also one
+    # from the start of that line
+    start = 0
+    while True:
+        pos = start
+        for c in query:
+            stop = len(text) if c == '\n' else text.find('\n', pos)
+            pos = text.find(c, pos, stop if stop >= 0 else len(text)) + 1
+            if not pos:
+                break
+        else:
+            return (start, pos)
+        start = text.find('\n', start) + 1
+        if not start:
+            return None
+
+
+def contains_in_order(text, chars):
+    """Does ``text`` contain the characters of ``chars``, in order?
+
+    Unlike :func:`match_allchars`, gaps may span newlines. Every rule of
+    :meth:`Workflow.filter` only matches a search key that contains the
+    query this way.
+
+    :param text: lower-case text to search
+    :type text: ``unicode``
+    :param chars: lower-case characters to find
+    :type chars: ``unicode``
+    :rtype: ``Boolean``
+
+    """
+    pos = 0
+    for c in chars:
+        pos = text.find(c, pos) + 1
+        if not pos:
+            return False
+    return True
+
+
+def fold_to_ascii(text):
+    """Convert non-ASCII characters to closest ASCII equivalent.
+
+    See :meth:`Workflow.fold_to_ascii`.
+
+    """
+    if isascii(text):
+        return text
+    text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+    return unicode(unicodedata.normalize('NFKD',
+                   text).encode('ascii', 'ignore'))
+
+
+@contextmanager
+def atomic_writer(path, mode='wb'):
+    """Open a temporary file that replaces ``path`` once written.
+
+    Readers of ``path`` see either the old or the new contents, never
+    a partly written file. If writing fails, ``path`` is left as it was.
+
+    :param path: file to write
+    :type path: ``unicode``
+    :param mode: mode to open the temporary file in
+    :type mode: ``unicode``
+
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp',
+                                     dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode) as file:
+            yield file
+        os.rename(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class LockFile(object):
+    """Advisory lock on ``path``, through a ``<path>.lock`` file.
+
+    Any number of processes may hold a shared lock at once; an
+    exclusive lock waits until no other lock is held. Locking is
+    skipped where :mod:`fcntl` is unavailable.
+
+    :param path: file to lock
+    :type path: ``unicode``
+    :param shared: take a shared (read) lock, not an exclusive one
+    :type shared: ``Boolean``
+
+    """
+
+    def __init__(self, path, shared=False):
+        self.lockfile = path + '.lock'
+        self.shared = shared
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.lockfile, 'a')
+            fcntl.flock(self._file,
+                        fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
 ####################################################################
 # Implementation classes
 ####################################################################
 
+class SerializerManager(object):
+    """Contains registered serializers.
+
+    A configured instance of this class is available at ``workflow.manager``.
+
+    Use :meth:`register()` to register new (or replace
+    existing) serializers, which you can specify by name when calling
+    :meth:`Workflow.cache_data`.
+
+    A ``serializer`` object must have ``load()`` and ``dump()`` methods
+    that work the same way as in the built-in :mod:`json` and
+    :mod:`pickle` libraries, i.e.:
+
+    .. code-block:: python
+        :linenos:
+
+        # Reading
+        data = serializer.load(open('filename', 'rb'))
+        # Writing
+        serializer.dump(data, open('filename', 'wb'))
+
+    It may also have a ``sniff(head)`` method, which returns ``True`` if
+    the first :const:`SNIFF_SIZE` bytes of a file, ``head``, were written
+    by it. :meth:`detect` uses these to pick the serializer that can read
+    a cache file, so files written with one serializer stay readable when
+    the default changes.
+
+    There are 4 pre-configured serializers: ``json``, ``pickle``,
+    ``cpickle`` and ``marshal``. The default is ``cpickle``, as it is
+    very fast and can handle most Python objects. ``marshal`` is faster
+    still, but only handles built-in types, e.g. ``dict``, ``list``,
+    ``tuple``, ``unicode`` and numbers.
+
+    If you need custom pickling, use the ``pickle`` serializer instead.
+
+    Be careful using ``json``: JSON only supports a subset of Python's
+    native data types (e.g., no ``tuple`` or :class:`set`) and
+    doesn't, for example, support ``dict`` keys that aren't strings.
+
+    See the built-in :mod:`cPickle`, :mod:`pickle`, :mod:`marshal` and
+    :mod:`json` libraries for more information on the serialization
+    formats.
+
+    """
+
+    def __init__(self):
+        self._serializers = {}
+
+    def register(self, name, serializer):
+        """Register ``serializer`` object under ``name``.
+
+        Raises :class:`AttributeError` if ``serializer`` in invalid.
+
+        :param name: Name to register ``serializer`` under
+        :type name: ``unicode`` or ``str``
+        :param serializer: object with ``load()`` and ``dump()``
+            methods
+
+        """
+
+        # Basic validation
+        getattr(serializer, 'load')
+        getattr(serializer, 'dump')
+
+        self._serializers[name] = serializer
+
+    def serializer(self, name):
+        """Return serializer object for ``name`` or ``None`` if no such
+        serializer is registered
+
+        :param name: Name of serializer to return
+        :type name: ``unicode`` or ``str``
+        :returns: serializer object or ``None``
+
+        """
+
+        return self._serializers.get(name)
+
+    def unregister(self, name):
+        """Remove registered serializer with ``name``
+
+        Raises a :class:`ValueError` if there is no such registered
+        serializer.
+
+        :param name: Name of serializer to remove
+        :type name: ``unicode`` or ``str``
+        :returns: serializer object
+
+        """
+
+        if name not in self._serializers:
+            raise ValueError('No such serializer registered : {}'.format(name))
+
+        serializer = self._serializers[name]
+        del self._serializers[name]
+
+        return serializer
+
+    def detect(self, head):
+        """Return name of the serializer that wrote data starting with
+        ``head`` or ``None`` if no serializer recognises it
+
+        :param head: first :const:`SNIFF_SIZE` bytes of a file
+        :type head: ``str``
+        :returns: serializer name or ``None``
+
+        """
+
+        for name in self.serializers:
+            sniff = getattr(self._serializers[name], 'sniff', None)
+            if sniff is not None and sniff(head):
+                return name
+        return None
+
+    @property
+    def serializers(self):
+        """Return names of registered serializers"""
+        return sorted(self._serializers.keys())
+
+
+class JSONSerializer(object):
+    """Wrapper around :mod:`json`. Sets ``indent`` and ``encoding``.
+
+    Use this serializer if you need readable data files. JSON doesn't
+    support Python objects as well as ``cPickle``/``pickle``, so be
+    careful which data you try to serialize as JSON.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        return json.load(file_obj)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        return json.dump(obj, file_obj, indent=2, encoding='utf-8')
+
+    @classmethod
+    def sniff(cls, head):
+        return head.lstrip()[:1] in (b'{', b'[', b'"')
+
+
+class CPickleSerializer(object):
+    """Wrapper around :mod:`cPickle`. Sets ``protocol``.
+
+    This is the default serializer and the best combination of speed and
+    flexibility. Binary protocol 2 loads several times faster than the
+    text protocol :mod:`pickle` uses by default.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        return cPickle.load(file_obj)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        return cPickle.dump(obj, file_obj, protocol=2)
+
+    @classmethod
+    def sniff(cls, head):
+        return head[:1] == b'\x80'
+
+
+class PickleSerializer(object):
+    """Wrapper around :mod:`pickle`. Sets ``protocol``.
+
+    Use this serializer if you need to add custom pickling.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        return pickle.load(file_obj)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        return pickle.dump(obj, file_obj, protocol=2)
+
+
+class MarshalSerializer(object):
+    """Wrapper around :mod:`marshal`. Adds a header.
+
+    The fastest serializer, but it only handles built-in types and its
+    format may change between Python versions, so the header records
+    the :mod:`marshal` version and files from another version fail to
+    load.
+
+    """
+
+    header = b'PDMR' + struct.pack(b'<H', marshal.version)
+
+    @classmethod
+    def load(cls, file_obj):
+        if file_obj.read(len(cls.header)) != cls.header:
+            raise ValueError('Not a marshal file of this Python version')
+        return marshal.load(file_obj)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        file_obj.write(cls.header)
+        return marshal.dump(obj, file_obj)
+
+    @classmethod
+    def sniff(cls, head):
+        return head[:4] == cls.header[:4]
+
+
+class ReadCache(object):
+    """Data loaded from cache files, kept for the rest of the process.
+
+    Entries are keyed by cache file and tagged with the file's version,
+    its mtime, size and inode, so an entry is only used while the file
+    is unchanged. Cache files are replaced rather than rewritten, so
+    every write gives the file a new inode.
+
+    A configured instance is available at ``workflow.read_cache``.
+    :meth:`Workflow.cached_data` reads through it and
+    :meth:`Workflow.cache_data` writes through it, so repeated reads
+    return the very same object. Changes made to that object are seen
+    by later reads in this process even if they are never cached.
+
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        # Reads that found no fresh cache file at all
+        self.absent = collections.Counter()
+
+    @staticmethod
+    def version(stat):
+        """Version of a file from its :func:`os.stat` result"""
+
+        return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+    def get(self, path, version, default=None):
+        """Return data cached for ``path`` at ``version`` or ``default``
+
+        Counts a hit or a miss for ``path``.
+
+        """
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == version:
+            self.hits[path] += 1
+            return entry[1]
+        self.misses[path] += 1
+        return default
+
+    def put(self, path, version, data):
+        """Keep ``data`` as the contents of ``path`` at ``version``"""
+
+        self._entries[path] = (version, data)
+
+    def discard(self, path):
+        """Forget any data kept for ``path``"""
+
+        self._entries.pop(path, None)
+
+    def clear(self):
+        """Forget all data and reset the counters"""
+
+        self._entries.clear()
+        self.hits.clear()
+        self.misses.clear()
+        self.absent.clear()
+
+    def hit_rate(self, path=None):
+        """Share of reads of ``path``, or of all reads, served from memory
+
+        :returns: ``float`` between 0 and 1, or ``None`` if there were
+            no reads
+
+        """
+
+        if path is None:
+            hits = sum(self.hits.values())
+            reads = hits + sum(self.misses.values())
+        else:
+            hits = self.hits[path]
+            reads = hits + self.misses[path]
+        if not reads:
+            return None
+        return float(hits) / reads
+
+
+# Set up default manager and register built-in serializers
+manager = SerializerManager()
+manager.register('cpickle', CPickleSerializer)
+manager.register('pickle', PickleSerializer)
+manager.register('marshal', MarshalSerializer)
+manager.register('json', JSONSerializer)
+
+# Process-wide cache of loaded data
+read_cache = ReadCache()
+
+
 class Item(object):
     """Represents a feedback item for Alfred. Generates Alfred-compliant
     XML for a single item.
@@ -539,49 +1047,408 @@ class Settings(dict):
         super(Settings, self).__init__()
         self._filepath = filepath
         self._nosave = False
+        self._batch_depth = 0
+        self._saved = None
         if os.path.exists(self._filepath):
             self._load()
         elif defaults:
-            for key, val in defaults.items():
-                self[key] = val
-            self._save()  # save default settings
+            with self.batch():  # save default settings
+                self.update(defaults)
 
     def _load(self):
         """Load cached settings from JSON file `self._filepath`"""
 
         self._nosave = True
-        with open(self._filepath, 'rb') as file:
-            for key, value in json.load(file, encoding='utf-8').items():
-                self[key] = value
+        with LockFile(self._filepath, shared=True):
+            with open(self._filepath, 'rb') as file:
+                for key, value in json.load(file, encoding='utf-8').items():
+                    self[key] = value
         self._nosave = False
+        self._saved = self._dumps()
+
+    def _dumps(self):
+        """Settings as they are written to `self._filepath`"""
+
+        return json.dumps(dict(self), sort_keys=True, indent=2,
+                          encoding='utf-8')
+
+    def save(self):
+        """Save settings to JSON file `self._filepath`.
 
-    def _save(self):
-        """Save settings to JSON file `self._filepath`"""
-        if self._nosave:
+        Nothing is written inside a :meth:`batch` or if the settings are
+        the same as when they were last loaded or saved.
+
+        """
+
+        if self._nosave or self._batch_depth:
             return
-        data = {}
-        for key, value in self.items():
-            data[key] = value
-        with open(self._filepath, 'wb') as file:
-            json.dump(data, file, sort_keys=True, indent=2, encoding='utf-8')
+        data = self._dumps()
+        if data == self._saved:
+            return
+        with LockFile(self._filepath):
+            with atomic_writer(self._filepath) as file:
+                file.write(data)
+        self._saved = data
+
+    @contextmanager
+    def batch(self):
+        """Context manager that saves all changes made within it at once.
+
+        Batches may be nested; the settings are saved when the outermost
+        one exits, even if it exits with an exception.
+
+        .. code-block:: python
+
+            with wf.settings.batch():
+                wf.settings['a'] = 1
+                wf.settings['b'] = 2
+
+        """
+
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            self.save()
 
     # dict methods
     def __setitem__(self, key, value):
         super(Settings, self).__setitem__(key, value)
-        self._save()
+        self.save()
 
     def update(self, *args, **kwargs):
         """Override :class:`dict` method to save on update."""
         super(Settings, self).update(*args, **kwargs)
-        self._save()
+        self.save()
 
     def setdefault(self, key, value=None):
         """Override :class:`dict` method to save on update."""
         ret = super(Settings, self).setdefault(key, value)
-        self._save()
+        self.save()
         return ret
 
 
+class SearchKey(object):
+    """Everything :meth:`Workflow.filter` compares a query against,
+    derived once from a single search key.
+
+    :param value: search key of an item
+    :type value: ``unicode``
+
+    """
+
+    __slots__ = ('value', 'lower', 'mask', 'rest', 'capitals', 'atoms',
+                 'initials')
+
+    def __init__(self, value, lower=None, capitals=None, atoms=None,
+                 initials=None):
+
+        self.value = value
+        self.lower = lower if lower is not None else value.lower()
+        self.mask, self.rest = char_mask(self.lower)
+        if capitals is None:
+            capitals = ''.join([c for c in value if c in INITIALS]).lower()
+        self.capitals = capitals
+        if atoms is None:
+            # split the item into "atoms", i.e. words separated by
+            # spaces or other non-word characters
+            atoms = tuple([s.lower() for s in split_on_delimiters(value)])
+        self.atoms = atoms
+        if initials is None:
+            # initials of the atoms
+            initials = ''.join([s[0] for s in atoms if s])
+        self.initials = initials
+
+    def fields(self):
+        """Fields to rebuild this key with, e.g. after unmarshalling"""
+
+        return (self.value, self.lower, self.capitals, self.atoms,
+                self.initials)
+
+
+class SearchIndex(object):
+    """Precomputed search keys for ``items``, to pass to
+    :meth:`Workflow.filter` instead of ``items`` and ``key``.
+
+    Build an index once, when the items change, and store
+    :meth:`fields` with them to reuse it with :meth:`from_fields`.
+
+    :param items: items to search
+    :type items: ``list`` or ``tuple``
+    :param key: function to get search key from ``items``. Must return a
+                ``unicode`` string. The default simply returns the item.
+    :type key: ``callable``
+
+    """
+
+    def __init__(self, items, key=lambda x: x, entries=None):
+
+        self.items = items
+        if entries is None:
+            entries = [self._entry(key(item).strip()) for item in items]
+        self.entries = entries
+        # ``(raw mask, folded mask)`` of each item, for `candidates`
+        self.masks = [(e[0].mask, e[1].mask) if e else (0, 0)
+                      for e in entries]
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_fields(cls, items, fields):
+        """Rebuild an index over ``items`` from its :meth:`fields`"""
+
+        entries = []
+        for row in fields:
+            if row is None:
+                entries.append(None)
+                continue
+            key = SearchKey(*row[0])
+            folded = key if row[1] is None else SearchKey(*row[1])
+            entries.append((key, folded))
+        return cls(items, entries=entries)
+
+    def fields(self):
+        """Index as plain tuples, suitable for :mod:`marshal` or JSON"""
+
+        fields = []
+        for entry in self.entries:
+            if entry is None:
+                fields.append(None)
+                continue
+            key, folded = entry
+            fields.append((key.fields(),
+                           None if folded is key else folded.fields()))
+        return fields
+
+    def candidates(self, raw, folded, start=0, stop=None):
+        """Positions of items whose keys contain every character of the
+        query, in one pass over the whole index (or ``start`` to ``stop``)
+
+        :param raw: :func:`char_mask` of query words compared against
+            the raw keys
+        :param folded: :func:`char_mask` of query words compared
+            against the ASCII-folded keys
+        :returns: ``list`` of positions, in order
+
+        """
+        raw_mask, raw_rest = raw
+        folded_mask, folded_rest = folded
+        positions = [i for i, (r, f) in
+                     enumerate(self.masks[start:stop], start)
+                     if r & raw_mask == raw_mask and
+                     f & folded_mask == folded_mask]
+        # Rarely needed: queries are mostly letters and digits
+        if raw_rest or folded_rest:
+            entries = self.entries
+            positions = [i for i in positions if entries[i] and
+                         raw_rest <= entries[i][0].rest and
+                         folded_rest <= entries[i][1].rest]
+        return positions
+
+    @staticmethod
+    def _entry(value):
+        """``(key, ASCII-folded key)`` for ``value``, or ``None`` if
+        ``value`` is empty and should never match"""
+
+        if value == '':
+            return None
+        key = SearchKey(value)
+        folded = fold_to_ascii(value)
+        if folded == value:
+            return (key, key)
+        return (key, SearchKey(folded))
+
+
+class FieldIndex(object):
+    """Precomputed search keys for several weighted fields of ``items``,
+    to pass to :meth:`Workflow.filter` instead of ``items`` and ``key``.
+
+    Each query word must match one of the fields and scores the best of
+    its weighted field scores. Give the primary field the highest
+    weight to rank matches on it first. Ties are sorted on the first
+    field.
+
+    :param items: items to search
+    :type items: ``list`` or ``tuple``
+    :param weights: ``(field, weight)`` pairs. ``field`` is the key or
+        attribute name of a field of the items, or a function to get it.
+    :type weights: ``tuple``
+    :param indexes: :class:`SearchIndex` of each field, if already built
+
+    """
+
+    def __init__(self, items, weights, indexes=None):
+
+        self.items = items
+        self.weights = tuple(weights)
+        if indexes is None:
+            indexes = [SearchIndex(items, _field_getter(field))
+                       for field, _ in self.weights]
+        self.indexes = indexes
+
+        # Characters in any field of each item, for `candidates`
+        self.masks = []
+        self.rests = []
+        for i in range(len(items)):
+            raw = folded = 0
+            raw_rest = folded_rest = frozenset()
+            for index in indexes:
+                entry = index.entries[i]
+                if entry is None:
+                    continue
+                raw |= entry[0].mask
+                folded |= entry[1].mask
+                raw_rest |= entry[0].rest
+                folded_rest |= entry[1].rest
+            self.masks.append((raw, folded))
+            self.rests.append((raw_rest, folded_rest))
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_fields(cls, items, weights, fields):
+        """Rebuild an index over ``items`` from its :meth:`fields`"""
+
+        return cls(items, weights, [SearchIndex.from_fields(items, f)
+                                    for f in fields])
+
+    def fields(self):
+        """:meth:`SearchIndex.fields` of each field"""
+
+        return [index.fields() for index in self.indexes]
+
+    def signature(self):
+        """Hash of all search keys, to tell indexes apart"""
+
+        return hash(tuple(tuple(e and e[0].value for e in index.entries)
+                          for index in self.indexes))
+
+    def subset(self, positions):
+        """Index of the items at ``positions``, with positions as items"""
+
+        return FieldIndex(positions, self.weights, [
+            SearchIndex(positions, entries=[index.entries[i]
+                                            for i in positions])
+            for index in self.indexes])
+
+    def candidates(self, raw, folded, start=0, stop=None):
+        """Positions of items whose fields contain every character of the
+        query between them. See :meth:`SearchIndex.candidates`."""
+
+        raw_mask, raw_rest = raw
+        folded_mask, folded_rest = folded
+        positions = [i for i, (r, f) in
+                     enumerate(self.masks[start:stop], start)
+                     if r & raw_mask == raw_mask and
+                     f & folded_mask == folded_mask]
+        if raw_rest or folded_rest:
+            rests = self.rests
+            positions = [i for i in positions if
+                         raw_rest <= rests[i][0] and
+                         folded_rest <= rests[i][1]]
+        return positions
+
+    def containing(self, plan):
+        """Positions of items with each word of :class:`QueryPlan`
+        ``plan`` in order in one of their fields.
+
+        These are all the items the plan's query, or any query starting
+        with it, can match. A query does not match all of them: a long
+        key can score nothing against a short query yet match a longer
+        one.
+
+        """
+
+        found = []
+        for i in self.candidates(plan.raw, plan.folded):
+            for word, fold in plan.words:
+                for index in self.indexes:
+                    entry = index.entries[i]
+                    if entry is not None and contains_in_order(
+                            (entry[1] if fold else entry[0]).lower, word):
+                        break
+                else:
+                    break
+            else:
+                found.append(i)
+        return found
+
+
+def _field_getter(field):
+    """Function to get ``field`` of an item for :class:`FieldIndex`"""
+
+    if callable(field):
+        return field
+
+    def getter(item):
+        if isinstance(item, dict):
+            return item[field]
+        return getattr(item, field)
+
+    return getter
+
+
+class QueryPlan(object):
+    """A query prepared once for :meth:`Workflow.filter`, to search any
+    number of item sources with.
+
+    Get one from :meth:`Workflow.query_plan`, which applies the user's
+    diacritic folding override.
+
+    :param query: query to test items against
+    :type query: ``unicode``
+    :param match_on: Filter option flags. Bitwise-combined list of
+        ``MATCH_*`` constants.
+    :type match_on: ``int``
+    :param fold_diacritics: Compare ASCII-only query words against
+        ASCII-folded search keys.
+    :type fold_diacritics: ``Boolean``
+    :param empty_query: query that matches all items
+
+    """
+
+    def __init__(self, query, match_on=MATCH_ALL, fold_diacritics=True,
+                 empty_query=''):
+
+        # Remove preceding/trailing spaces
+        query = query.strip()
+        self.query = query
+        self.match_on = match_on
+        self.fold_diacritics = fold_diacritics
+
+        # Full data set if query is empty
+        self.empty = query == empty_query
+        if empty_query:
+            query = query.replace(empty_query, '')
+
+        # Lower-case each word once, noting which may use folded keys
+        self.words = []
+        for word in query.split(' '):
+            word = word.strip().lower()
+            if word:
+                self.words.append((word, fold_diacritics and isascii(word)))
+
+        # Characters of each word, and of the words compared against
+        # raw and folded keys
+        self.masks = []
+        raw_mask = folded_mask = 0
+        raw_rest = folded_rest = frozenset()
+        for word, fold in self.words:
+            mask, rest = char_mask(word)
+            self.masks.append((mask, rest))
+            if fold:
+                folded_mask |= mask
+                folded_rest |= rest
+            else:
+                raw_mask |= mask
+                raw_rest |= rest
+        self.raw = (raw_mask, raw_rest)
+        self.folded = (folded_mask, folded_rest)
+
+
 class Workflow(object):
     """Create new :class:`Workflow` instance.
 
@@ -625,7 +1492,7 @@ class Workflow(object):
         self._info_loaded = False
         self._logger = None
         self._items = []
-        self._search_pattern_cache = {}
+        self._cache_serializer = 'cpickle'
         if libraries:
             sys.path = libraries + sys.path
 
@@ -915,11 +1782,57 @@ class Workflow(object):
                                       self._default_settings)
         return self._settings
 
+    @property
+    def cache_serializer(self):
+        """Name of default cache serializer.
+
+        This serializer is used by :meth:`cache_data()` unless it is
+        given another one.
+
+        See :class:`SerializerManager` for details.
+
+        :returns: serializer name
+        :rtype: ``unicode``
+
+        """
+
+        return self._cache_serializer
+
+    @cache_serializer.setter
+    def cache_serializer(self, serializer_name):
+        """Set the default cache serialization format.
+
+        The specified serializer must already by registered with the
+        :class:`SerializerManager` at `~workflow.workflow.manager`,
+        otherwise a :class:`ValueError` will be raised.
+
+        :param serializer_name: Name of default serializer to use.
+        :type serializer_name: ``unicode``
+
+        """
+
+        if manager.serializer(serializer_name) is None:
+            raise ValueError(
+                'Unknown serializer : `{}`. Register your serializer '
+                'with `manager` first.'.format(serializer_name))
+
+        self.logger.debug(
+            'default cache serializer set to `{}`'.format(serializer_name))
+
+        self._cache_serializer = serializer_name
+
     def cached_data(self, name, data_func=None, max_age=60):
         """Retrieve data from cache or re-generate and re-cache data if
         stale/non-existant. If ``max_age`` is 0, return cached data no
         matter how old.
 
+        The serializer that wrote the cache file is detected from its
+        first bytes, so it needn't be :attr:`cache_serializer`.
+
+        Data is kept in :data:`read_cache`, so reading it again while the
+        file is unchanged returns the same object without touching the
+        file.
+
         :param name: name of datastore
         :type name: ``unicode``
         :param data_func: function to (re-)generate data.
@@ -933,41 +1846,78 @@ class Workflow(object):
         """
 
         cache_path = self.cachefile('%s.cache' % name)
-        age = self.cached_data_age(name)
-        if (age < max_age or max_age == 0) and os.path.exists(cache_path):
-            with open(cache_path, 'rb') as file:
-                self.logger.debug('Loading cached data from : %s',
-                                  cache_path)
-                return pickle.load(file)
+        try:
+            stat = os.stat(cache_path)
+        except OSError:
+            stat = None
+        if stat is not None and (max_age == 0 or
+                                 time.time() - stat.st_mtime < max_age):
+            data = read_cache.get(cache_path, ReadCache.version(stat),
+                                  _MISSING)
+            if data is not _MISSING:
+                return data
+            with LockFile(cache_path, shared=True):
+                with open(cache_path, 'rb') as file:
+                    # Files without a recognised header predate the
+                    # serializer registry and were written by `pickle`
+                    serializer_name = (manager.detect(file.read(SNIFF_SIZE))
+                                       or 'pickle')
+                    file.seek(0)
+                    self.logger.debug('Loading %s cached data from : %s',
+                                      serializer_name, cache_path)
+                    data = manager.serializer(serializer_name).load(file)
+                    read_cache.put(cache_path,
+                                   ReadCache.version(os.fstat(file.fileno())),
+                                   data)
+                    return data
+        read_cache.absent[cache_path] += 1
         if not data_func:
             return None
         data = data_func()
         self.cache_data(name, data)
         return data
 
-    def cache_data(self, name, data):
+    def cache_data(self, name, data, serializer=None):
         """Save ``data`` to cache under ``name``.
 
         If ``data`` is ``None``, the corresponding cache file will be deleted.
 
+        Data is written to a temporary file that then replaces the cache
+        file, so readers in other processes never see half-written data.
+
         :param name: name of datastore
         :type name: ``unicode``
         :param data: data to store
-        :type data: any object supported by :mod:`pickle`
+        :type data: any object supported by ``serializer``
+        :param serializer: name of a serializer registered with
+            :class:`SerializerManager`. Defaults to :attr:`cache_serializer`.
+        :type serializer: ``unicode``
 
         """
 
-        cache_path = self.cachefile('%s.cache' % name)
+        serializer_name = serializer or self.cache_serializer
+        serializer = manager.serializer(serializer_name)
+        if serializer is None:
+            raise ValueError(
+                'Unknown serializer : `{}`. Register your serializer '
+                'with `manager` first.'.format(serializer_name))
 
-        if data is None:
-            if os.path.exists(cache_path):
-                os.unlink(cache_path)
-                self.logger.debug('Deleted cache file : %s', cache_path)
-            return
+        cache_path = self.cachefile('%s.cache' % name)
 
-        with open(cache_path, 'wb') as file:
-            pickle.dump(data, file)
-        self.logger.debug('Cached data saved at : %s', cache_path)
+        with LockFile(cache_path):
+            read_cache.discard(cache_path)
+            if data is None:
+                if os.path.exists(cache_path):
+                    os.unlink(cache_path)
+                    self.logger.debug('Deleted cache file : %s', cache_path)
+                return
+
+            with atomic_writer(cache_path) as file:
+                serializer.dump(data, file)
+            read_cache.put(cache_path, ReadCache.version(os.stat(cache_path)),
+                           data)
+        self.logger.debug('Cached %s data saved at : %s', serializer_name,
+                          cache_path)
 
     def cached_data_fresh(self, name, max_age):
         """Is data cached at `name` less than `max_age` old?
@@ -1004,16 +1954,22 @@ class Workflow(object):
 
     def filter(self, query, items, key=lambda x: x, empty_query='',
                ascending=False, include_score=False, min_score=0, 
-               max_results=0, match_on=MATCH_ALL, fold_diacritics=True):
+               max_results=0, match_on=MATCH_ALL, fold_diacritics=True,
+               parallel=None):
         """Fuzzy search filter. Returns list of ``items`` that match ``query``.
 
         ``query`` is case-insensitive. Any item that does not contain the
         entirety of ``query`` is rejected.
 
-        :param query: query to test items against
-        :type query: ``unicode``
-        :param items: iterable of items to test
-        :type items: ``list`` or ``tuple``
+        :param query: query to test items against, or a :class:`QueryPlan`
+            of it, in which case ``empty_query``, ``match_on`` and
+            ``fold_diacritics`` are those of the plan
+        :type query: ``unicode`` or :class:`QueryPlan`
+        :param items: iterable of items to test, or a :class:`SearchIndex`
+            or :class:`FieldIndex` of them, in which case ``key`` is
+            ignored
+        :type items: ``list``, ``tuple``, :class:`SearchIndex` or
+            :class:`FieldIndex`
         :param key: function to get comparison key from ``items``. Must return a
                     ``unicode`` string. The default simply returns the item.
         :type key: ``callable``
@@ -1027,6 +1983,8 @@ class Workflow(object):
             than this.
         :type min_score: ``int``
         :param max_results: If non-zero, prune results list to this length.
+            Only the best ``max_results`` matches are kept while
+            filtering, rather than sorting all of them.
         :type max_results: ``int``
         :param match_on: Filter option flags. Bitwise-combined list of
             ``MATCH_*`` constants (see below).
@@ -1034,6 +1992,10 @@ class Workflow(object):
         :param fold_diacritics: Convert search keys to ASCII-only
             characters if ``query`` only contains ASCII characters.
         :type fold_diacritics: ``Boolean``
+        :param parallel: Score more than :const:`PARALLEL_SAMPLE` items
+            with a process pool: ``True`` always, ``False`` never,
+            ``None`` when measurements show it to be faster.
+        :type parallel: ``Boolean`` or ``None``
         :returns: list of ``items`` matching ``query`` or list of
             ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
             ``rule`` is the ``MATCH_`` rule that matched the item.
@@ -1055,13 +2017,13 @@ class Workflow(object):
         9. :const:`MATCH_ALL` : Combination of all the above.
 
 
-        ``MATCH_ALLCHARS`` is considerably slower than the other tests and
-        provides much less accurate results.
+        ``MATCH_ALLCHARS`` provides much less accurate results than the
+        other tests. It takes time linear in the length of the search key.
 
         **Examples:**
 
-        To ignore ``MATCH_ALLCHARS`` (tends to provide the worst matches and
-        is expensive to run), use ``match_on=MATCH_ALL ^ MATCH_ALLCHARS``.
+        To ignore ``MATCH_ALLCHARS`` (tends to provide the worst matches),
+        use ``match_on=MATCH_ALL ^ MATCH_ALLCHARS``.
 
         To match only on capitals, use ``match_on=MATCH_CAPITALS``.
 
@@ -1082,39 +2044,123 @@ class Workflow(object):
         If ``query`` contains non-ASCII characters, search keys will not be
         altered.
 
+        **Search index**
+
+        Pass a :class:`SearchIndex` as ``items`` to filter the same items
+        many times without deriving their search keys again.
+
+        Pass a :class:`FieldIndex` to search several fields of the items,
+        weighted so that matches on the primary field rank first.
+
+        **Query plan**
+
+        Pass a :class:`QueryPlan` from :meth:`query_plan` as ``query`` to
+        search several item sources without preparing ``query`` again.
+
+        **Process pool**
+
+        Large sources can be split across one process per CPU. The first
+        :const:`PARALLEL_SAMPLE` items are scored in-process and timed.
+        Together with the measured cost of a pool, cached for
+        :const:`POOL_OVERHEAD_AGE`, this decides whether the rest is
+        scored faster by a pool. Each worker returns only its best
+        ``max_results`` matches.
+
         """
 
-        # Remove preceding/trailing spaces
-        query = query.strip()
+        if isinstance(items, (SearchIndex, FieldIndex)):
+            index = items
+            items = index.items
+        else:
+            index = None
+
+        if isinstance(query, QueryPlan):
+            plan = query
+        else:
+            plan = self.query_plan(query, match_on, fold_diacritics,
+                                   empty_query)
 
         # Return full data set if query is empty
-        if query == empty_query:
+        if plan.empty:
             return items
 
-        if empty_query:
-            query = query.replace(empty_query, '')
+        if index is None:
+            index = SearchIndex(items, key)
+
+        if parallel is not False and len(index) > PARALLEL_SAMPLE:
+            results = self._parallel_matches(index, plan, max_results,
+                                             parallel)
+        else:
+            results = self._matches(index, plan)
+
+        # sort on keys, then discard the keys. Keys are unique, so
+        # the `max_results` best are the head of the full sort.
+        if max_results:
+            results = heapq.nsmallest(max_results, results)
+        else:
+            results = sorted(results)
+        results = [(items[k[2]], score, rule) for k, score, rule in results]
+
+        if min_score:
+            results = [r for r in results if r[1] > min_score]
+
+        if ascending:
+            results.reverse()
+
+        # return list of ``(item, score, rule)``
+        if include_score:
+            return results
+        # just return list of items
+        return [t[0] for t in results]
+
+    def query_plan(self, query, match_on=MATCH_ALL, fold_diacritics=True,
+                   empty_query=''):
+        """Prepare ``query`` for :meth:`filter`, once for any number of
+        searches. See :meth:`filter` for the arguments.
+
+        :returns: :class:`QueryPlan`
+
+        """
 
         # Use user override if there is one
         fold_diacritics = self.settings.get('__workflows_diacritic_folding',
                                             fold_diacritics)
+        return QueryPlan(query, match_on, fold_diacritics, empty_query)
+
+    def _matches(self, index, plan, start=0, stop=None):
+        """Generate ``(sort key, score, rule)`` for each item of
+        :class:`SearchIndex` or :class:`FieldIndex` ``index`` matching
+        :class:`QueryPlan` ``plan``. The position of the item is the
+        last part of its sort key.
+
+        """
+
+        if isinstance(index, FieldIndex):
+            return self._field_matches(index, plan, start, stop)
+        return self._key_matches(index, plan, start, stop)
 
-        results = []
+    def _key_matches(self, index, plan, start, stop):
+        """:meth:`_matches` of a :class:`SearchIndex`"""
 
-        for i, item in enumerate(items):
+        words = plan.words
+        match_on = plan.match_on
+
+        # pre-filter any items that do not contain all characters
+        # of the query to save on scoring them word by word
+        entries = index.entries
+        for i in index.candidates(plan.raw, plan.folded, start, stop):
+            entry = entries[i]
+            if entry is None:
+                continue
             skip = False
             score = 0
-            words = [s.strip() for s in query.split(' ')]
-            value = key(item).strip()
-            if value == '':
-                continue
-            for word in words:
-                if word == '':
-                    continue
-                s, r = self._filter_item(value, word, match_on,
-                                         fold_diacritics)
+            for word, fold in words:
+                s, r = self._rules(entry[1] if fold else entry[0], word,
+                                   match_on)
 
                 if not s:  # Skip items that don't match part of the query
                     skip = True
+                    break
                 score += s
 
             if skip:
@@ -1124,76 +2170,138 @@ class Workflow(object):
                 # use "reversed" `score` (i.e. highest becomes lowest) and
                 # `value` as sort key. This means items with the same score
                 # will be sorted in alphabetical not reverse alphabetical order
-                results.append(((100.0 / score, value.lower(), i),
-                                (item, score, r)))
+                yield ((100.0 / score, entry[0].lower, i), score, r)
 
-        # sort on keys, then discard the keys
-        results.sort()
-        results = [t[1] for t in results]
+    def _field_matches(self, index, plan, start, stop):
+        """:meth:`_matches` of a :class:`FieldIndex`"""
 
-        if max_results and len(results) > max_results:
-            results = results[:max_results]
+        words = zip(plan.words, plan.masks)
+        match_on = plan.match_on
+        fields = zip([idx.entries for idx in index.indexes],
+                     [weight for _, weight in index.weights])
+        primary = index.indexes[0].entries
 
-        if min_score:
-            results = [r for r in results if r[1] > min_score]
+        for i in index.candidates(plan.raw, plan.folded, start, stop):
+            skip = False
+            score = 0
+            for (word, fold), (mask, rest) in words:
+                # Best weighted score of `word` in any field
+                best = r = 0
+                for entries, weight in fields:
+                    entry = entries[i]
+                    if entry is None:
+                        continue
+                    key = entry[1] if fold else entry[0]
+                    if key.mask & mask != mask or not rest <= key.rest:
+                        continue
+                    s, rule = self._rules(key, word, match_on)
+                    if s * weight > best:
+                        best, r = s * weight, rule
+
+                if not best:  # Skip items that don't match part of the query
+                    skip = True
+                    break
+                score += best
 
-        if ascending:
-            results = results.reverse()
+            if skip:
+                continue
 
-        # return list of ``(item, score, rule)``
-        if include_score:
-            return results
-        # just return list of items
-        return [t[0] for t in results]
+            if score:
+                value = primary[i][0].lower if primary[i] else ''
+                yield ((100.0 / score, value, i), score, r)
 
-    def _filter_item(self, value, query, match_on, fold_diacritics):
-        """Filter ``value`` against ``query`` using rules ``match_on``
+    def _parallel_matches(self, index, plan, max_results, force):
+        """Like :meth:`_matches`, but score items after the first
+        :const:`PARALLEL_SAMPLE` with a process pool if it is faster
+        (or ``force`` is ``True``)
 
-        :returns: ``(score, rule)``
+        """
+
+        global _pool_state
+
+        size = len(index)
+        start = time.time()
+        results = list(self._matches(index, plan, 0, PARALLEL_SAMPLE))
+        per_item = (time.time() - start) / PARALLEL_SAMPLE
+        workers = multiprocessing.cpu_count()
+
+        if not force:
+            if workers < 2:
+                return itertools.chain(
+                    results, self._matches(index, plan, PARALLEL_SAMPLE))
+            # Items at which a pool's cost is outweighed by its speed-up
+            threshold = PARALLEL_SAMPLE + self._pool_overhead(workers) / (
+                max(per_item, 1e-9) * (1 - 1.0 / workers))
+            self.logger.debug('Process pool threshold : %d items',
+                              threshold)
+            if size < threshold:
+                return itertools.chain(
+                    results, self._matches(index, plan, PARALLEL_SAMPLE))
+
+        step = (size - PARALLEL_SAMPLE) // workers + 1
+        spans = [(i, min(i + step, size))
+                 for i in range(PARALLEL_SAMPLE, size, step)]
+        _pool_state = (self, index, plan, max_results)
+        try:
+            pool = multiprocessing.Pool(workers)
+            try:
+                chunks = pool.map(_pool_matches, spans)
+            finally:
+                pool.terminate()
+        finally:
+            _pool_state = None
+
+        for chunk in chunks:
+            results.extend(chunk)
+        return results
+
+    def _pool_overhead(self, workers):
+        """Seconds to start, use and stop a pool of ``workers`` processes.
+        Measured once per :const:`POOL_OVERHEAD_AGE`.
 
         """
 
-        query = query.lower()
-        queryset = set(query)
+        def measure():
+            start = time.time()
+            pool = multiprocessing.Pool(workers)
+            pool.map(abs, range(workers))
+            pool.close()
+            pool.join()
+            return time.time() - start
 
-        if not isascii(query):
-            fold_diacritics = False
+        return self.cached_data('filter_pool_%d' % workers, measure,
+                                max_age=POOL_OVERHEAD_AGE)
 
-        rule = None
-        score = 0
+    def _rules(self, key, query, match_on):
+        """Score :class:`SearchKey` ``key`` against lower-case ``query``
+        using rules ``match_on``, which it is known to contain all
+        characters of
 
-        if fold_diacritics:
-            value = self.fold_to_ascii(value)
+        :returns: ``(score, rule)``
 
-        # pre-filter any items that do not contain all characters
-        # of ``query`` to save on running several more expensive tests
-        if not queryset <= set(value.lower()):
-            return (0, None)
+        """
+
+        value = key.value
+        rule = None
+        score = 0
 
         # item starts with query
         if (match_on & MATCH_STARTSWITH and
-                value.lower().startswith(query)):
+                key.lower.startswith(query)):
             score = 100.0 - (len(value) / len(query))
             rule = MATCH_STARTSWITH
 
         if not score and match_on & MATCH_CAPITALS:
             # query matches capitalised letters in item,
             # e.g. of = OmniFocus
-            initials = ''.join([c for c in value if c in INITIALS])
-            if initials.lower().startswith(query):
+            initials = key.capitals
+            if initials.startswith(query):
                 score = 100.0 - (len(initials) / len(query))
                 rule = MATCH_CAPITALS
 
         if not score:
-            if (match_on & MATCH_ATOM or
-                    match_on & MATCH_INITIALS_CONTAIN or
-                    match_on & MATCH_INITIALS_STARTSWITH):
-                # split the item into "atoms", i.e. words separated by
-                # spaces or other non-word characters
-                atoms = [s.lower() for s in split_on_delimiters(value)]
-                # print('atoms : %s  -->  %s' % (value, atoms))
-                # initials of the atoms
-                initials = ''.join([s[0] for s in atoms if s])
+            atoms = key.atoms
+            initials = key.initials
 
             if match_on & MATCH_ATOM:
                 # is `query` one of the atoms in item?
@@ -1222,7 +2330,7 @@ class Workflow(object):
 
         if not score:
             # `query` is a substring of item
-            if match_on & MATCH_SUBSTRING and query in value.lower():
+            if match_on & MATCH_SUBSTRING and query in key.lower:
                     score = 90.0 - (len(value) / len(query))
                     rule = MATCH_SUBSTRING
 
@@ -1230,32 +2338,16 @@ class Workflow(object):
             # finally, assign a score based on how close together the
             # characters in `query` are in item.
             if match_on & MATCH_ALLCHARS:
-                search = self._search_for_query(query)
-                match = search(value)
+                match = match_allchars(key.lower, query)
                 if match:
-                    score = 100.0 / ((1 + match.start()) *
-                                     (match.end() - match.start() + 1))
+                    start, end = match
+                    score = 100.0 / ((1 + start) * (end - start + 1))
                     rule = MATCH_ALLCHARS
 
         if score > 0:
             return (score, rule)
         return (0, None)
 
-    def _search_for_query(self, query):
-        if query in self._search_pattern_cache:
-            return self._search_pattern_cache[query]
-
-        # Build pattern: include all characters
-        pattern = []
-        for c in query:
-            # pattern.append('[^{0}]*{0}'.format(re.escape(c)))
-            pattern.append('.*?{0}'.format(re.escape(c)))
-        pattern = ''.join(pattern)
-        search = re.compile(pattern, re.IGNORECASE).search
-
-        self._search_pattern_cache[query] = search
-        return search
-
     def run(self, func):
         """Call `func` to run your workflow
 
@@ -1518,11 +2610,7 @@ class Workflow(object):
         :rtype: ``unicode``
 
         """
-        if isascii(text):
-            return text
-        text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
-        return unicode(unicodedata.normalize('NFKD',
-                       text).encode('ascii', 'ignore'))
+        return fold_to_ascii(text)
 
     def _load_info_plist(self):
         """Load workflow info from ``info.plist``